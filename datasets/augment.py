@@ -0,0 +1,234 @@
+import os
+import random
+import multiprocessing
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Callable, List, Tuple, Union
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from filesystem import make_dataset
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+DONE_LOG = ".augment_done.log"
+
+_TRANSFORM = None
+
+
+def image_seed(relpath: str, seed: int = 0) -> int:
+    """
+    Seed of an image, stable across runs, machines and worker scheduling.
+    """
+    return zlib.crc32(("%d:%s" % (seed, relpath)).encode("utf-8")) & 0x7FFFFFFF
+
+
+def _init_worker(transform: Callable) -> None:
+    global _TRANSFORM
+    _TRANSFORM = transform
+
+
+def _attach(name: str, shape: tuple, dtype: str) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _to_shared(array: np.ndarray) -> Tuple[shared_memory.SharedMemory, tuple]:
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _release(shm: shared_memory.SharedMemory) -> None:
+    shm.close()
+    shm.unlink()
+
+
+def _decode(path: str, flags: int) -> Union[tuple, None]:
+    img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), flags)
+    if img is None:
+        return None
+    return _to_shared(img)
+
+
+def _transform_frame(frame: tuple, seed: int) -> Union[tuple, None]:
+    """
+    Transform a frame in place when the output fits, otherwise return a new
+    shared block holding the output.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    cv2.setRNGSeed(seed)
+    shm, img = _attach(*frame)
+    try:
+        out = _TRANSFORM(img)
+        if out is img:
+            return None
+        if out.shape == img.shape and out.dtype == img.dtype:
+            img[...] = out
+            return None
+        out_shm, out_frame = _to_shared(out)
+        out_shm.close()  # the parent unlinks it once written
+        return out_frame
+    finally:
+        del img
+        shm.close()
+
+
+def _encode_write(frame: tuple, path: str, params: List[int]) -> None:
+    shm, img = _attach(*frame)
+    try:
+        ok, data = cv2.imencode(os.path.splitext(path)[1], img, params)
+    finally:
+        del img
+        shm.close()
+    if not ok:
+        raise RuntimeError(f"Failed to encode {path}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data.tobytes())
+
+
+def augment_directory(
+    transform: Callable,
+    src_dir: str,
+    dst_dir: str,
+    ext: Union[str, Tuple[str, ...]] = IMAGE_EXTS,
+    out_ext: str = None,
+    seed: int = 0,
+    max_workers: int = None,
+    decoders: int = 4,
+    writers: int = 4,
+    max_inflight: int = None,
+    params: List[int] = None,
+    flags: int = cv2.IMREAD_COLOR,
+    resume: bool = True,
+    progress: bool = True,
+) -> List[Tuple[str, str]]:
+    """
+    Apply a transform to every image under `src_dir` and mirror the tree to `dst_dir`.
+
+    Threads decode ahead of the transform, worker processes transform
+    frames that are passed through shared memory instead of pickled, and
+    other threads encode and write results while the next frames are being
+    transformed. `random`, `numpy.random` and OpenCV are seeded from
+    `image_seed(relpath, seed)` before each image, so random transforms
+    give the same output whatever the worker or the order.
+
+    Written images are appended to `dst_dir/.augment_done.log`; with
+    `resume`, the images it lists are skipped.
+
+    Args:
+        transform(Callable): picklable `transform(img) -> img`, e.g. a `transform.Compose`.
+        ext(str | tuple): input extension(s), see `filesystem.make_dataset`.
+        out_ext(str): output extension like `.png`, defaults to the input one.
+        max_workers(int): transform processes, one per CPU by default.
+        max_inflight(int): images decoded but not yet written, bounding memory.
+        params(List[int]): `cv2.imencode` parameters, like `[cv2.IMWRITE_JPEG_QUALITY, 95]`.
+        flags(int): `cv2.imdecode` flags, 3-channel BGR by default as most transforms expect.
+
+    Returns:
+        `(relpath, error)` of the images that failed, to be retried on the next run.
+
+    Usage:
+      >>> augment_directory(Compose([White2Colour(100)]), "images/", "augmented/")
+    """
+    max_workers = max_workers or os.cpu_count()
+    max_inflight = max_inflight or 4 * max_workers
+    params = params or []
+
+    relpaths = sorted(os.path.relpath(x, src_dir) for x in make_dataset(src_dir, ext))
+    log_path = os.path.join(dst_dir, DONE_LOG)
+    done = set()
+    if resume and os.path.exists(log_path):
+        with open(log_path, "r", encoding="utf-8") as f:
+            done = {x.rstrip("\n") for x in f if x.endswith("\n")}
+    todo = [x for x in relpaths if x not in done]
+
+    os.makedirs(dst_dir, exist_ok=True)
+    bar = tqdm(total=len(relpaths), initial=len(relpaths) - len(todo), disable=not progress)
+    todo = iter(todo)
+    failures = []
+    pending = {}  # future -> (stage, relpath, frame, shared blocks to release)
+    decode_pool = ThreadPoolExecutor(max_workers=decoders)
+    write_pool = ThreadPoolExecutor(max_workers=writers)
+    # forking while the decode threads run can copy held locks into workers, so spawn them
+    process_pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(transform,),
+    )
+    log = open(log_path, "a" if resume else "w", encoding="utf-8")
+
+    def feed() -> None:
+        relpath = next(todo, None)
+        if relpath is not None:
+            future = decode_pool.submit(_decode, os.path.join(src_dir, relpath), flags)
+            pending[future] = ("decode", relpath, None, [])
+
+    def out_path(relpath: str) -> str:
+        if out_ext:
+            relpath = os.path.splitext(relpath)[0] + out_ext
+        return os.path.join(dst_dir, relpath)
+
+    try:
+        for _ in range(max_inflight):
+            feed()
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, relpath, frame, blocks = pending.pop(future)
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, repr(e)
+
+                if stage == "decode" and error is None:
+                    if result is None:
+                        error = "cannot decode"
+                    else:
+                        shm, frame = result
+                        future = process_pool.submit(_transform_frame, frame, image_seed(relpath, seed))
+                        pending[future] = ("transform", relpath, frame, [shm])
+                        continue
+                if stage == "transform" and error is None:
+                    if result is not None:  # transform changed shape, output has its own block
+                        blocks.append(shared_memory.SharedMemory(name=result[0]))
+                        frame = result
+                    future = write_pool.submit(_encode_write, frame, out_path(relpath), params)
+                    pending[future] = ("write", relpath, frame, blocks)
+                    continue
+
+                for shm in blocks:
+                    _release(shm)
+                if error is None:
+                    log.write(relpath + "\n")
+                else:
+                    failures.append((relpath, error))
+                bar.update(1)
+                feed()
+            log.flush()
+    finally:
+        for future in pending:
+            future.cancel()
+        decode_pool.shutdown(wait=True)
+        write_pool.shutdown(wait=True)
+        process_pool.shutdown(wait=True, cancel_futures=True)
+        for future, (stage, _, _, blocks) in pending.items():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                result = future.result()
+                if stage == "decode" and result is not None:
+                    blocks = blocks + [result[0]]
+                elif stage == "transform" and result is not None:  # (name, shape, dtype)
+                    try:
+                        blocks = blocks + [shared_memory.SharedMemory(name=result[0])]
+                    except FileNotFoundError:
+                        pass
+            for shm in blocks:
+                _release(shm)
+        log.close()
+        bar.close()
+    return failures
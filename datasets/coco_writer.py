@@ -0,0 +1,223 @@
+import os
+import shutil
+import tempfile
+from typing import Iterable, List, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from datasets.rasterize import Frame, Shape
+from filesystem import json_dumps
+
+
+def polygon_areas(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Shoelace area of each polygon `coords[offsets[i]:offsets[i + 1]]`.
+    """
+    counts = np.diff(offsets)
+    starts = offsets[:-1]
+    areas = np.zeros(len(counts), dtype=np.float64)
+    valid = counts > 0
+    if not valid.any():
+        return areas
+
+    x = coords[:, 0].astype(np.float64)
+    y = coords[:, 1].astype(np.float64)
+    # next vertex of each vertex, wrapping to the first one of its polygon
+    nxt = np.arange(1, len(coords) + 1)
+    nxt[offsets[1:][valid] - 1] = starts[valid]
+    cross = x * y[nxt] - x[nxt] * y
+    areas[valid] = 0.5 * np.abs(np.add.reduceat(cross, starts[valid]))
+    return areas
+
+
+def polygon_bboxes(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    `(N, 4)` `[x_min, y_min, x_max, y_max]` of each non-empty polygon.
+    """
+    starts = offsets[:-1]
+    return np.concatenate(
+        [np.minimum.reduceat(coords, starts), np.maximum.reduceat(coords, starts)], axis=1
+    ).astype(np.float64)
+
+
+def shape_geometry(shapes: List[Shape]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Area and COCO `[x, y, w, h]` bbox of each shape, summing the areas and
+    joining the boxes of grouped polygons. Computed in one pass over all the
+    polygons of an image.
+    """
+    polygons = [np.asarray(x, dtype=np.float32).reshape(-1, 2) for s in shapes for x in s[1]]
+    polygons = [x for x in polygons if len(x)]
+    parts = [sum(len(x) > 0 for x in s[1]) for s in shapes]
+    if not polygons:
+        return np.zeros(len(shapes)), np.zeros((len(shapes), 4))
+
+    counts = np.array([len(x) for x in polygons])
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    coords = np.concatenate(polygons, axis=0)
+    areas = polygon_areas(coords, offsets)
+    boxes = polygon_bboxes(coords, offsets)
+
+    shape_areas = np.zeros(len(shapes))
+    shape_boxes = np.zeros((len(shapes), 4))
+    has_parts = np.array(parts) > 0
+    starts = np.concatenate([[0], np.cumsum(parts)[:-1]])[has_parts]
+    shape_areas[has_parts] = np.add.reduceat(areas, starts)
+    lower = np.minimum.reduceat(boxes[:, :2], starts)
+    upper = np.maximum.reduceat(boxes[:, 2:], starts)
+    shape_boxes[has_parts] = np.concatenate([lower, upper - lower], axis=1)
+    return shape_areas, shape_boxes
+
+
+class CocoWriter(object):
+    """
+    Write COCO json incrementally: images go straight to the output file
+    while annotations are spooled to a temporary file next to it, and
+    categories are appended when the file is closed. Memory stays bounded
+    by one image.
+
+    With `shard_size`, a new file `<stem>-00001.json` ... is started every
+    `shard_size` images. Image and annotation ids stay unique across shards.
+    Categories not given upfront are numbered from 1 as they are met, so a
+    shard lists only the ones known when it is closed.
+
+    Args:
+        path(str): output file.
+        categories(List[str]): category names, ids starting from 1.
+        shard_size(int): number of images per file.
+        precision(int): decimals kept in segmentation coordinates.
+
+    Usage:
+      >>> with CocoWriter("coco.json") as writer:
+      ...     for name, height, width, shapes in cvat_frames(project):
+      ...         writer.add_image(name, height, width, shapes)
+    """
+
+    def __init__(
+        self, path: str, categories: List[str] = None, shard_size: int = None, precision: int = 2
+    ) -> None:
+        self.path = path
+        self.shard_size = shard_size
+        self.precision = precision
+        self.categories = {x: i for i, x in enumerate(categories or [], 1)}
+        self.__fixed_categories = categories is not None
+        self.paths = []
+        self.__image_id = 0
+        self.__ann_id = 0
+        self.__file = None
+        self.__spool = None
+        self.__shard_images = 0
+
+    def __shard_path(self) -> str:
+        if self.shard_size is None:
+            return self.path
+        stem, ext = os.path.splitext(self.path)
+        return "%s-%05d%s" % (stem, len(self.paths), ext or ".json")
+
+    def __open(self) -> None:
+        path = self.__shard_path()
+        out_dir = os.path.dirname(path) or "."
+        os.makedirs(out_dir, exist_ok=True)
+        self.__file = open(path + ".tmp", "wb")
+        self.__spool = tempfile.TemporaryFile(dir=out_dir)
+        self.__file.write(b'{"images":[')
+        self.__shard_images = 0
+        self.paths.append(path)
+
+    def __finish(self) -> None:
+        if self.__file is None:
+            return
+        self.__file.write(b'],"annotations":[')
+        self.__spool.seek(0)
+        shutil.copyfileobj(self.__spool, self.__file)
+        self.__spool.close()
+        categories = [{"id": i, "name": x, "supercategory": ""} for x, i in self.categories.items()]
+        self.__file.write(b'],"categories":' + json_dumps(categories) + b"}")
+        self.__file.close()
+        os.replace(self.__file.name, self.paths[-1])
+        self.__file = self.__spool = None
+
+    def __category_id(self, label: str) -> int:
+        if label not in self.categories:
+            if self.__fixed_categories:
+                raise KeyError(f"Unknown category: {label}")
+            self.categories[label] = len(self.categories) + 1
+        return self.categories[label]
+
+    def add_image(self, file_name: str, height: int, width: int, shapes: List[Shape]) -> int:
+        """
+        Write one image and its `(label, polygons, iscrowd)` shapes, returning the image id.
+        """
+        if self.__file is None:
+            self.__open()
+        elif self.shard_size and self.__shard_images >= self.shard_size:
+            self.__finish()
+            self.__open()
+
+        self.__image_id += 1
+        image = {"id": self.__image_id, "file_name": file_name, "height": height, "width": width}
+        self.__file.write((b"," if self.__shard_images else b"") + json_dumps(image))
+        self.__shard_images += 1
+
+        areas, boxes = shape_geometry(shapes)
+        chunks = []
+        for (label, polygons, iscrowd), area, box in zip(shapes, areas, boxes):
+            self.__ann_id += 1
+            segmentation = [
+                np.round(np.asarray(x, dtype=np.float64), self.precision).ravel().tolist()
+                for x in polygons
+                if len(x)
+            ]
+            ann = {
+                "id": self.__ann_id,
+                "image_id": self.__image_id,
+                "category_id": self.__category_id(label),
+                "segmentation": segmentation,
+                "area": float(area),
+                "bbox": np.round(box, self.precision).tolist(),
+                "iscrowd": int(iscrowd),
+            }
+            chunks.append(json_dumps(ann))
+        if chunks:
+            prefix = b"," if self.__spool.tell() else b""
+            self.__spool.write(prefix + b",".join(chunks))
+        return self.__image_id
+
+    def close(self) -> None:
+        if self.__file is None and not self.paths:
+            self.__open()  # still write a valid, empty file
+        self.__finish()
+
+    def __enter__(self) -> "CocoWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        if self.__file is not None:  # keep the previous output, drop the partial one
+            self.__file.close()
+            self.__spool.close()
+            os.remove(self.__file.name)
+            self.paths.pop()
+
+
+def export_coco(
+    frames: Iterable[Frame],
+    path: str,
+    categories: List[str] = None,
+    shard_size: int = None,
+    progress: bool = True,
+) -> List[str]:
+    """
+    Stream frames, e.g. `rasterize.cvat_frames(ProjectInstance(file, streaming=True))`
+    or `rasterize.labelme_frames(dataset, image_names=True)`, into COCO file(s).
+
+    Returns:
+        paths of the written files.
+    """
+    with CocoWriter(path, categories, shard_size) as writer:
+        for name, height, width, shapes in tqdm(frames, disable=not progress):
+            writer.add_image(name, height, width, shapes)
+    return writer.paths
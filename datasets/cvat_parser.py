@@ -1,15 +1,141 @@
 import os
+import pickle
+import shutil
+import hashlib
+import xml.etree.ElementTree as ET
+from bisect import bisect_left
+
+import numpy as np
 import xmltodict
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Tuple, Union
+
+from utils import iter_parallel
+
+
+def _element_to_dict(elem: ET.Element) -> Union[dict, str, None]:
+    """
+    Convert an element the way `xmltodict.parse` does: `@attr` keys, one key
+    per child tag (a list when repeated), and `#text` / plain str for text.
+    """
+    result = {"@" + k: v for k, v in elem.attrib.items()}
+    for child in elem:
+        value = _element_to_dict(child)
+        if child.tag not in result:
+            result[child.tag] = value
+        elif isinstance(result[child.tag], list):
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = [result[child.tag], value]
+
+    text = elem.text.strip() if elem.text else ""
+    if text:
+        if not result:
+            return text
+        result["#text"] = text
+    return result or None
+
+
+def _iter_top_elements(file: str) -> Iterator[ET.Element]:
+    """
+    Incrementally yield the direct children of the root element, releasing
+    each one once the consumer moves on so memory stays flat.
+    """
+    with open(file, "rb") as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        depth = 0
+        for event, elem in context:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 0:
+                yield elem
+                root.clear()
+
+
+class PolygonBuffer(object):
+    """
+    Ragged storage of many polygons: one `(N, 2)` float32 coordinate buffer
+    plus `offsets`, polygon `i` being `coords[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray) -> None:
+        self.coords = coords
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, point_strings: List[str]) -> "PolygonBuffer":
+        """
+        Parse CVAT `"x,y;x,y;..."` strings in bulk.
+        """
+        offsets = np.zeros(len(point_strings) + 1, dtype=np.int64)
+        if not point_strings:
+            return cls(np.zeros((0, 2), dtype=np.float32), offsets)
+        np.cumsum([x.count(";") + 1 for x in point_strings], out=offsets[1:])
+        values = np.fromstring(",".join(point_strings).replace(";", ","), dtype=np.float32, sep=",")
+        if values.size != 2 * offsets[-1]:
+            raise ValueError("Malformed polygon points")
+        return cls(values.reshape(-1, 2), offsets)
+
+    @classmethod
+    def concatenate(cls, buffers: List["PolygonBuffer"]) -> "PolygonBuffer":
+        if not buffers:
+            return cls.from_strings([])
+        coords = np.concatenate([x.coords for x in buffers], axis=0)
+        starts = np.cumsum([0] + [len(x.coords) for x in buffers[:-1]])
+        offsets = np.concatenate(
+            [buffers[0].offsets[:1]] + [x.offsets[1:] + start for x, start in zip(buffers, starts)]
+        )
+        return cls(coords, offsets)
+
+    def slice(self, start: int, stop: int) -> "PolygonBuffer":
+        """
+        Polygons `start` to `stop` (excluded), sharing coordinates with self.
+        """
+        offsets = self.offsets[start : stop + 1]
+        return PolygonBuffer(self.coords[offsets[0] : offsets[-1]], offsets - offsets[0])
+
+    def select(self, indices: List[int]) -> "PolygonBuffer":
+        """
+        New buffer holding a copy of the given polygons.
+        """
+        return PolygonBuffer.concatenate(
+            [PolygonBuffer(self[i], np.array([0, len(self[i])], dtype=np.int64)) for i in indices]
+        )
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def as_array(self) -> np.ndarray:
+        return self.coords
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        return self.coords[self.offsets[idx] : self.offsets[idx + 1]]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
 
 
 class AnnotationInstance(object):
+    """
+    One polygon, or several polygons sharing a group id once merged.
+
+    Coordinates live in a `PolygonBuffer` shared with the other annotations
+    of the image; the annotation only records which polygons are its own.
+    """
+
     EMPTY = ""
 
-    def __init__(self, info: dict) -> None:
+    def __init__(
+        self, info: dict, buffer: PolygonBuffer = None, polygon_ids: List[int] = None
+    ) -> None:
         self.__info = info
-        self.__points = None
+        self.__buffer = buffer
+        self.__polygon_ids = polygon_ids if polygon_ids is not None else [0]
         self.__iscrowd = None
+        self.__attributes = None
 
     def merge(self, ann_b):
         assert (
@@ -19,20 +145,42 @@ class AnnotationInstance(object):
             ann_b.label_name,
         )
 
-        self.__points = self.points + ann_b.points
+        if self.buffer is ann_b.buffer:
+            self.__polygon_ids = self.__polygon_ids + ann_b.polygon_ids
+        else:
+            self.__buffer = PolygonBuffer.concatenate(
+                [self.buffer.select(self.__polygon_ids), ann_b.buffer.select(ann_b.polygon_ids)]
+            )
+            self.__polygon_ids = list(range(len(self.__buffer)))
         self.__iscrowd = self.iscrowd or ann_b.iscrowd
 
     @property
-    def points(self) -> List[list]:
-        if self.__points:
-            return self.__points
+    def buffer(self) -> PolygonBuffer:
+        if self.__buffer is None:
+            self.__buffer = PolygonBuffer.from_strings([self.__info["@points"]])
+        return self.__buffer
 
-        self.__points = [[]]  # In case is a truncated object
-        point_string_list = self.__info["@points"].split(";")
-        for point_string in point_string_list:
-            point = [float(x) for x in point_string.split(",")]
-            self.__points[0].append(point)
-        return self.__points
+    @property
+    def polygon_ids(self) -> List[int]:
+        return self.__polygon_ids
+
+    @property
+    def points(self) -> List[np.ndarray]:
+        """
+        One `(K, 2)` float32 array per polygon, as views into the shared buffer.
+        """
+        buffer = self.buffer
+        return [buffer[i] for i in self.__polygon_ids]
+
+    def as_array(self) -> np.ndarray:
+        """
+        `(K, 2)` coordinates of all polygons of the annotation, a zero-copy
+        view unless merged polygons are not adjacent in the buffer.
+        """
+        ids, buffer = self.__polygon_ids, self.buffer
+        if ids == list(range(ids[0], ids[0] + len(ids))):
+            return buffer.coords[buffer.offsets[ids[0]] : buffer.offsets[ids[-1] + 1]]
+        return np.concatenate(self.points, axis=0)
 
     @property
     def label_name(self) -> str:
@@ -44,23 +192,39 @@ class AnnotationInstance(object):
             return self.EMPTY
         return self.__info["@group_id"]
 
+    def __parse_attri(self) -> None:
+        attributes = self.__info.get("attribute") or []
+        attributes = attributes if isinstance(attributes, list) else [attributes]
+        self.__attributes = {
+            x["@name"]: x.get("#text", self.EMPTY) if isinstance(x, dict) else self.EMPTY
+            for x in attributes
+        }
+
     @property
-    def iscrowd(self) -> bool:
-        if self.__iscrowd:
-            return self.__iscrowd
+    def attributes(self) -> Dict[str, str]:
+        if self.__attributes is None:
+            self.__parse_attri()
+        return self.__attributes
 
-        self.__parse_attri()
-        self.__iscrowd = self.__iscrowd or False
+    @property
+    def iscrowd(self) -> bool:
+        if self.__iscrowd is None:
+            self.__iscrowd = self.attributes.get("iscrowd", "").lower() == "true"
         return self.__iscrowd
 
+    @property
+    def category(self) -> str:
+        return self.attributes.get("category", self.EMPTY)
+
     @property
     def has_category(self) -> bool:
         return self.category != self.EMPTY
 
 
 class ImageInstance(object):
-    def __init__(self, info: dict) -> None:
+    def __init__(self, info: dict, buffer: PolygonBuffer = None) -> None:
         self.__info = info
+        self.__buffer = buffer
         self.__ann = None
 
     @property
@@ -92,11 +256,11 @@ class ImageInstance(object):
         if "polygon" not in self.__info:
             return self.__ann
 
-        polygons = self.__info["polygon"]
-        polygons = polygons if isinstance(polygons, list) else [polygons]
+        polygons = self.__polygon_infos
+        buffer = self.polygons
         recorder = {}  # k: group_id, v: idx
-        for polygon in polygons:
-            ann = AnnotationInstance(polygon)
+        for idx, polygon in enumerate(polygons):
+            ann = AnnotationInstance(polygon, buffer, [idx])
             if ann.group_id == ann.EMPTY:
                 self.__ann.append(ann)
                 continue
@@ -114,39 +278,429 @@ class ImageInstance(object):
 
         return self.__ann
 
+    @property
+    def __polygon_infos(self) -> List[dict]:
+        polygons = self.__info.get("polygon") or []
+        return polygons if isinstance(polygons, list) else [polygons]
+
+    @property
+    def polygons(self) -> PolygonBuffer:
+        """
+        All polygons of the image, in file order, packed in one buffer.
+        """
+        if self.__buffer is None:
+            self.__buffer = PolygonBuffer.from_strings(
+                [x["@points"] for x in self.__polygon_infos]
+            )
+        return self.__buffer
+
     @property
     def has_annotated(self) -> bool:
         return len(self.annotations) > 0
 
 
 class ProjectInstance(object):
-    def __init__(self, file) -> None:
+    """
+    Annotations of a CVAT task export (CVAT for images 1.1).
+
+    Args:
+        file(str): path of the exported xml.
+        streaming(bool): only parse `meta` up front and read `<image>` elements
+            one at a time in `iter_images`, so memory doesn't grow with the
+            export size. `images` still works but loads every image.
+        cache_dir(str): opt-in directory caching the parsed task in a binary
+            layout, so that loading the same export again skips xml parsing
+            and memory-maps the polygon arrays. Ignored when streaming.
+        cache_key(str): how a cache entry is matched with the export, `stat`
+            for size + mtime, `hash` for a content hash.
+    """
+
+    CACHE_VERSION = 1
+    __ARRAYS = ("coords", "offsets", "image_offsets", "label_ids", "group_ids")
+
+    def __init__(
+        self,
+        file: str,
+        streaming: bool = False,
+        cache_dir: str = None,
+        cache_key: str = "stat",
+    ) -> None:
         self.name = os.path.splitext(os.path.basename(file))[0]
+        self.file = file
+        self.streaming = streaming
+        self.__reset()
+
+        cache_path, cached = None, False
+        if cache_dir is not None and not streaming:
+            cache_path = self.__cache_path(cache_dir, cache_key)
+            cached = self.__load_cache(cache_path)
+
+        if streaming:
+            self.__info = {"annotations": {"meta": self.__read_meta(file)}}
+        elif not cached:
+            with open(file, mode="r", encoding="utf-8") as f:
+                self.__info = xmltodict.parse(f.read())
+        self.__setup_segments()
+
+        if cache_path is not None and not cached:
+            self.__save_cache(cache_path)
+
+    def __reset(self) -> None:
+        self.__polygons = None
+        self.__image_offsets = None
+        self.__label_names = None
+        self.__label_ids = None
+        self.__group_ids = None
+        self.__images = None
+        self.__name2frame = None
+        self.__url = None
 
-        with open(file, mode="r", encoding="utf-8") as f:
-            self.__info = xmltodict.parse(f.read())
-
+    def __setup_segments(self) -> None:
         job_info = self.meta["task"]["segments"]["segment"]
         job_info = job_info if isinstance(job_info, list) else [job_info]
         self.__segments = {}
         for job in job_info:
             job_id = int(job["url"].split("=")[-1])
             self.__segments[job_id] = (int(job["start"]), int(job["stop"]))
+        self.__job_url = job_info[0]["url"]
+        self.__build_interval_index()
+
+    def __getstate__(self) -> dict:
+        """
+        Pickle the packed representation, e.g. to send a parsed task back
+        from a worker process, instead of the xml dict.
+        """
+        return {
+            "name": self.name,
+            "file": self.file,
+            "streaming": self.streaming,
+            "meta": self.meta,
+            "payload": None if self.streaming else self.__pack(),
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.name = state["name"]
+        self.file = state["file"]
+        self.streaming = state["streaming"]
+        self.__reset()
+        if state["payload"] is None:
+            self.__info = {"annotations": {"meta": state["meta"]}}
+        else:
+            self.__unpack(state["payload"])
+        self.__setup_segments()
+
+    def __cache_path(self, cache_dir: str, cache_key: str) -> str:
+        """
+        `<cache_dir>/<name>-<path digest>-<content digest>`; the path digest
+        groups entries of one export so stale ones can be dropped.
+        """
+        source = hashlib.sha1(os.path.abspath(self.file).encode("utf-8")).hexdigest()[:8]
+        if cache_key == "stat":
+            st = os.stat(self.file)
+            content = hashlib.sha1(f"{st.st_size}-{st.st_mtime_ns}".encode("utf-8"))
+        elif cache_key == "hash":
+            content = hashlib.sha1()
+            with open(self.file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    content.update(chunk)
+        else:
+            raise ValueError(f"Unsupported cache key: {cache_key}")
+        digest = f"{content.hexdigest()[:16]}-v{self.CACHE_VERSION}"
+        return os.path.join(cache_dir, f"{self.name}-{source}-{digest}")
+
+    def __pack(self) -> dict:
+        """
+        Compact representation: polygon coordinates and per polygon label /
+        group ids as arrays, everything else as an xml skeleton without points.
+        """
+        polygons = self.polygons
+        label_names, label_ids, group_ids, image_infos = {}, [], [], []
+        for img_info in self.__image_infos:
+            img_info = dict(img_info)
+            polygon_infos = img_info.get("polygon") or []
+            polygon_infos = polygon_infos if isinstance(polygon_infos, list) else [polygon_infos]
+            if "polygon" in img_info:
+                img_info["polygon"] = [
+                    {k: v for k, v in x.items() if k != "@points"} for x in polygon_infos
+                ]
+            for x in polygon_infos:
+                label_ids.append(label_names.setdefault(x["@label"], len(label_names)))
+                group_ids.append(int(x.get("@group_id", -1)))
+            image_infos.append(img_info)
+
+        return {
+            "info": {"annotations": {"meta": self.meta, "image": image_infos}},
+            "label_names": list(label_names),
+            "coords": polygons.coords,
+            "offsets": polygons.offsets,
+            "image_offsets": self.__image_offsets,
+            "label_ids": np.array(label_ids, dtype=np.int32),
+            "group_ids": np.array(group_ids, dtype=np.int64),
+        }
+
+    def __unpack(self, payload: dict) -> None:
+        self.__info = payload["info"]
+        self.__polygons = PolygonBuffer(payload["coords"], payload["offsets"])
+        self.__image_offsets = payload["image_offsets"]
+        self.__label_names = payload["label_names"]
+        self.__label_ids = payload["label_ids"]
+        self.__group_ids = payload["group_ids"]
+
+    def __polygon_table(self) -> None:
+        if self.__label_ids is None:
+            payload = self.__pack()
+            self.__label_names = payload["label_names"]
+            self.__label_ids = payload["label_ids"]
+            self.__group_ids = payload["group_ids"]
 
-        self.__images = None
-        self.__url = None
+    @property
+    def label_names(self) -> List[str]:
+        """
+        Labels used by polygons, in order of first appearance.
+        """
+        self.__polygon_table()
+        return self.__label_names
+
+    @property
+    def polygon_label_ids(self) -> np.ndarray:
+        """
+        Index in `label_names` of each polygon of `polygons`.
+        """
+        self.__polygon_table()
+        return self.__label_ids
+
+    @property
+    def polygon_group_ids(self) -> np.ndarray:
+        """
+        Group id of each polygon of `polygons`, -1 when not grouped.
+        """
+        self.__polygon_table()
+        return self.__group_ids
+
+    def __save_cache(self, cache_path: str) -> None:
+        payload = self.__pack()
+        tmp_path = "%s.tmp%d" % (cache_path, os.getpid())
+        os.makedirs(tmp_path, exist_ok=True)
+        for key in self.__ARRAYS:
+            np.save(os.path.join(tmp_path, key + ".npy"), payload[key])
+        with open(os.path.join(tmp_path, "info.pkl"), "wb") as f:
+            pickle.dump(
+                {"info": payload["info"], "label_names": payload["label_names"]},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+
+        # drop stale entries of the same export, then publish atomically
+        prefix = os.path.basename(cache_path).rsplit("-", 2)[0] + "-"
+        for entry in os.listdir(os.path.dirname(cache_path)):
+            stale = os.path.join(os.path.dirname(cache_path), entry)
+            if entry.startswith(prefix) and ".tmp" not in entry and stale != cache_path:
+                shutil.rmtree(stale, ignore_errors=True)
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:  # written meanwhile by another process
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def __load_cache(self, cache_path: str) -> bool:
+        if not os.path.isdir(cache_path):
+            return False
+        try:
+            with open(os.path.join(cache_path, "info.pkl"), "rb") as f:
+                payload = pickle.load(f)
+            for key in self.__ARRAYS:
+                payload[key] = np.load(os.path.join(cache_path, key + ".npy"), mmap_mode="r")
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            shutil.rmtree(cache_path, ignore_errors=True)
+            return False
+        self.__unpack(payload)
+        return True
+
+    def __build_interval_index(self) -> None:
+        """
+        Sort segments by stop so that the first segment with `stop >= frame`
+        is found by bisection. Overlapping CVAT segments keep the scan order
+        result (lowest start first); nested ones, which CVAT never produces,
+        fall back to a linear scan.
+        """
+        order = sorted(self.__segments.items(), key=lambda x: (x[1][1], x[1][0]))
+        self.__job_ids = np.array([job_id for job_id, _ in order], dtype=np.int64)
+        self.__starts = np.array([ranges[0] for _, ranges in order], dtype=np.int64)
+        self.__stops = np.array([ranges[1] for _, ranges in order], dtype=np.int64)
+        self.__stop_list = self.__stops.tolist()
+        self.__bisectable = bool(np.all(np.diff(self.__starts) >= 0))
+
+    @staticmethod
+    def __read_meta(file: str) -> dict:
+        for elem in _iter_top_elements(file):
+            if elem.tag == "meta":
+                return _element_to_dict(elem)
+        raise ValueError(f"No meta found in {file}")
+
+    @staticmethod
+    def __keep(img_info: dict, only_annotated: bool, labels: Union[set, None]) -> bool:
+        polygons = img_info.get("polygon") or []
+        polygons = polygons if isinstance(polygons, list) else [polygons]
+        if only_annotated and not polygons:
+            return False
+        if labels is not None:
+            return any(polygon["@label"] in labels for polygon in polygons)
+        return True
+
+    def iter_images(
+        self, only_annotated: bool = False, labels: Iterable[str] = None
+    ) -> Iterator[ImageInstance]:
+        """
+        Yield images one at a time, in file order.
+
+        Args:
+            only_annotated(bool): skip frames without any polygon.
+            labels(Iterable[str]): only keep frames having a polygon with one of these labels.
+        """
+        labels = set(labels) if labels is not None else None
+        if self.streaming:
+            img_infos = (
+                _element_to_dict(elem)
+                for elem in _iter_top_elements(self.file)
+                if elem.tag == "image"
+            )
+            for img_info in img_infos:
+                if self.__keep(img_info, only_annotated, labels):
+                    yield ImageInstance(img_info)
+            return
+
+        polygons, image_offsets = self.polygons, self.__image_offsets
+        for idx, img_info in enumerate(self.__image_infos):
+            if self.__keep(img_info, only_annotated, labels):
+                buffer = polygons.slice(image_offsets[idx], image_offsets[idx + 1])
+                yield ImageInstance(img_info, buffer)
+
+    @property
+    def __image_infos(self) -> List[dict]:
+        img_infos = self.__info["annotations"].get("image") or []
+        return img_infos if isinstance(img_infos, list) else [img_infos]
+
+    @property
+    def polygons(self) -> PolygonBuffer:
+        """
+        Every polygon of the task packed in one buffer, parsed in a single pass.
+        Images own consecutive polygons, in file order. Not available in
+        streaming mode.
+        """
+        if self.streaming:
+            raise RuntimeError("Packed polygons are not available in streaming mode")
+        if self.__polygons is not None:
+            return self.__polygons
+
+        point_strings, counts = [], []
+        for img_info in self.__image_infos:
+            polygons = img_info.get("polygon") or []
+            polygons = polygons if isinstance(polygons, list) else [polygons]
+            point_strings.extend(x["@points"] for x in polygons)
+            counts.append(len(polygons))
+        self.__image_offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        self.__polygons = PolygonBuffer.from_strings(point_strings)
+        return self.__polygons
 
     def frame2job(self, frame_id: int) -> int:
-        for job_id, ranges in self.__segments.items():
-            if ranges[0] <= frame_id <= ranges[1]:
-                return job_id
-        raise ValueError(f"invalid frame id: {frame_id}")
+        if not self.__bisectable:
+            for job_id, ranges in self.__segments.items():
+                if ranges[0] <= frame_id <= ranges[1]:
+                    return job_id
+            raise ValueError(f"invalid frame id: {frame_id}")
+
+        idx = bisect_left(self.__stop_list, frame_id)
+        if idx == len(self.__stop_list) or self.__starts[idx] > frame_id:
+            raise ValueError(f"invalid frame id: {frame_id}")
+        return int(self.__job_ids[idx])
+
+    def frames_to_jobs(self, frame_ids: Union[List[int], np.ndarray]) -> np.ndarray:
+        """
+        Vectorized `frame2job`.
+
+        Args:
+            frame_ids(list | np.ndarray): integer frame ids.
+
+        Returns:
+            np.ndarray: int64 job ids, aligned with frame_ids.
+        """
+        frames = np.asarray(frame_ids)
+        if frames.size and not np.issubdtype(frames.dtype, np.integer):
+            if not np.issubdtype(frames.dtype, np.floating) or np.any(frames != np.round(frames)):
+                raise ValueError(f"frame ids must be integers, got dtype {frames.dtype}")
+        frames = frames.astype(np.int64)
+        if not self.__bisectable:
+            return np.array([self.frame2job(int(x)) for x in frames.ravel()], dtype=np.int64).reshape(frames.shape)
+
+        idx = np.searchsorted(self.__stops, frames, side="left")
+        clipped = np.minimum(idx, len(self.__stops) - 1)
+        valid = (idx < len(self.__stops)) & (self.__starts[clipped] <= frames)
+        if not np.all(valid):
+            invalid = np.unique(frames[~valid])
+            raise ValueError(
+                "%d invalid frame id(s): %s%s, task %s has %d segment(s) within [%d, %d]"
+                % (
+                    invalid.size,
+                    invalid[:10].tolist(),
+                    " ..." if invalid.size > 10 else "",
+                    self.name,
+                    len(self.__stops),
+                    self.__starts.min(),
+                    self.__stops.max(),
+                )
+            )
+        return self.__job_ids[clipped]
+
+    @property
+    def name2frame(self) -> Dict[str, int]:
+        """
+        Image basename -> frame id, built without parsing annotations.
+        """
+        if self.__name2frame is not None:
+            return self.__name2frame
+
+        if self.streaming:
+            img_infos = (
+                elem.attrib for elem in _iter_top_elements(self.file) if elem.tag == "image"
+            )
+            key = ""
+        else:
+            img_infos = self.__image_infos
+            key = "@"
+        self.__name2frame = {
+            os.path.basename(info[key + "name"]): int(info[key + "id"]) for info in img_infos
+        }
+        return self.__name2frame
+
+    def create_urls(
+        self,
+        frame_ids: Union[List[int], np.ndarray] = None,
+        basenames: Iterable[str] = None,
+    ) -> List[str]:
+        """
+        Bulk `create_url` over frame ids or image basenames.
+        """
+        if basenames is not None:
+            name2frame = self.name2frame
+            try:
+                frame_ids = [name2frame[name] for name in basenames]
+            except KeyError as e:
+                raise KeyError(f"image {e.args[0]!r} not found in task {self.name}") from None
+        elif frame_ids is None:
+            raise ValueError("either frame_ids or basenames is required")
+        # validated as given, so that e.g. 1.5 is rejected rather than truncated
+        jobs = self.frames_to_jobs(frame_ids)
+        frames = np.asarray(frame_ids).astype(np.int64)
+        url = self.url
+        return [
+            f"{url}/jobs/{job_id}?frame={frame_id}"
+            for job_id, frame_id in zip(jobs.tolist(), frames.tolist())
+        ]
 
     def create_url(
         self, job_id: int = None, frame_id: int = None, basename: str = None
     ) -> str:
         if basename is not None:
-            frame_id = self.images[basename].frame_id
+            frame_id = self.name2frame[basename]
         if frame_id is not None:
             job_id = self.frame2job(frame_id)
             return f"{self.url}/jobs/{job_id}?frame={frame_id}"
@@ -166,7 +720,8 @@ class ProjectInstance(object):
     def url(self) -> str:
         if self.__url:
             return self.__url
-        self.__url = self.__segments[0]["url"].split("?")[0].strip(":8080/")
+        url = self.__job_url.split("?")[0].rstrip("/")
+        self.__url = url[: -len(":8080")] if url.endswith(":8080") else url
         return self.__url
 
     @property
@@ -175,10 +730,7 @@ class ProjectInstance(object):
             return self.__images
 
         self.__images = {}
-        img_list = self.__info["annotations"]["image"]
-        img_list = img_list if isinstance(img_list, list) else [img_list]
-        for img_info in img_list:
-            img_ins = ImageInstance(img_info)
+        for img_ins in self.iter_images():
             try:
                 _ = img_ins.annotations
             except AssertionError as e:
@@ -188,3 +740,128 @@ class ProjectInstance(object):
 
             self.__images[img_ins.basename] = img_ins
         return self.__images
+
+
+def _load_project(file: str, cache_dir: str = None) -> ProjectInstance:
+    project = ProjectInstance(file, cache_dir=cache_dir)
+    _ = project.polygons  # parse points in the worker
+    return project
+
+
+class CvatDataset(object):
+    """
+    Many CVAT task exports parsed in a process pool and merged into one
+    collection of images, indexed by key.
+
+    Args:
+        files(List[str]): exported xml files, their order decides collisions.
+        max_workers(int): number of worker processes, one per CPU by default.
+        cache_dir(str): forwarded to `ProjectInstance`.
+        on_collision(str): what to do with an image whose basename is taken
+            by a previous one. `rename` keys it as `<task name>/<basename>`,
+            `first` / `last` keep the first / last one, `error` raises.
+
+    Usage:
+      >>> dataset = CvatDataset(sorted(glob("exports/*.xml")), max_workers=16)
+      >>> for key, ann in dataset.iter_label("cat"):
+      ...     print(dataset.create_url(key), ann.as_array().shape)
+    """
+
+    def __init__(
+        self,
+        files: List[str],
+        max_workers: int = None,
+        cache_dir: str = None,
+        on_collision: str = "rename",
+        progress: bool = True,
+    ) -> None:
+        assert on_collision in ("rename", "first", "last", "error")
+        self.projects = list(
+            iter_parallel(
+                _load_project,
+                [(file, cache_dir) for file in files],
+                max_workers=max_workers,
+                backend="process",
+                progress=progress,
+            )
+        )
+
+        self.__index = {}  # key -> (project idx, image)
+        for project_idx, project in enumerate(self.projects):
+            for image in project.iter_images():
+                key = image.basename
+                if key in self.__index:
+                    if on_collision == "error":
+                        raise ValueError(f"Duplicated image {key} in task {project.name}")
+                    if on_collision == "first":
+                        continue
+                    if on_collision == "rename":
+                        key = f"{project.name}/{image.basename}"
+                        suffix = 1
+                        while key in self.__index:
+                            key = f"{project.name}/{image.basename}#{suffix}"
+                            suffix += 1
+                self.__index[key] = (project_idx, image)
+        self.__labels = None
+
+    def project_of(self, key: str) -> ProjectInstance:
+        return self.projects[self.__index[key][0]]
+
+    def create_url(self, key: str) -> str:
+        return self.project_of(key).create_url(frame_id=self[key].frame_id)
+
+    def create_urls(self, keys: Iterable[str]) -> List[str]:
+        """
+        Bulk `create_url`, grouping frames per task.
+        """
+        keys = list(keys)
+        groups = {}  # project idx -> positions in keys
+        for pos, key in enumerate(keys):
+            groups.setdefault(self.__index[key][0], []).append(pos)
+
+        urls = [None] * len(keys)
+        for project_idx, positions in groups.items():
+            frame_ids = [self.__index[keys[pos]][1].frame_id for pos in positions]
+            for pos, url in zip(positions, self.projects[project_idx].create_urls(frame_ids)):
+                urls[pos] = url
+        return urls
+
+    def __build_label_index(self) -> None:
+        self.__labels = {}  # label -> [(key, annotation idx)]
+        for key, (_, image) in self.__index.items():
+            for ann_idx, ann in enumerate(image.annotations):
+                self.__labels.setdefault(ann.label_name, []).append((key, ann_idx))
+
+    @property
+    def label_names(self) -> List[str]:
+        if self.__labels is None:
+            self.__build_label_index()
+        return list(self.__labels.keys())
+
+    def iter_label(self, label: str) -> Iterator[Tuple[str, AnnotationInstance]]:
+        """
+        Yield `(key, annotation)` of every annotation with the given label.
+        """
+        if self.__labels is None:
+            self.__build_label_index()
+        for key, ann_idx in self.__labels.get(label, []):
+            yield key, self[key].annotations[ann_idx]
+
+    def keys(self) -> List[str]:
+        return list(self.__index.keys())
+
+    def items(self) -> Iterator[Tuple[str, ImageInstance]]:
+        for key, (_, image) in self.__index.items():
+            yield key, image
+
+    def __getitem__(self, key: str) -> ImageInstance:
+        return self.__index[key][1]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__index)
+
+    def __len__(self) -> int:
+        return len(self.__index)
@@ -1,6 +1,12 @@
+import os
 import json
+from typing import List, Tuple, Union
+
 import numpy as np
 
+from filesystem import read_json_file, scan_files
+from utils import iter_parallel
+
 
 class Annotation(object):
     def __init__(self, ann_file: str) -> None:
@@ -35,3 +41,146 @@ class Annotation(object):
             self.__contours.append(contour)
 
         return self.__contours
+
+
+def shape_to_polygon(shape_type: str, points: np.ndarray, circle_points: int = 32) -> np.ndarray:
+    """
+    Turn a LabelMe shape into `(K, 2)` polygon vertices.
+
+    `rectangle` is given by two opposite corners and `circle` by its center
+    and a point on the circle; other shape types keep their points as is.
+    """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    if shape_type == "rectangle" and len(points) == 2:
+        (x1, y1), (x2, y2) = points
+        return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+    if shape_type == "circle" and len(points) == 2:
+        center = points[0]
+        radius = np.linalg.norm(points[1] - points[0])
+        angles = np.linspace(0, 2 * np.pi, circle_points, endpoint=False)
+        circle = np.stack([np.cos(angles), np.sin(angles)], axis=1) * radius + center
+        return circle.astype(np.float32)
+    return points
+
+
+def _load_labelme(ann_file: str) -> tuple:
+    """
+    Keep only what `LabelmeDataset` packs, dropping e.g. `imageData`.
+    """
+    content = read_json_file(ann_file)
+    shapes = content.get("shapes") or []
+    coords = [np.asarray(x["points"], dtype=np.float32).reshape(-1, 2) for x in shapes]
+    return (
+        content["imagePath"],
+        (content["imageHeight"], content["imageWidth"]),
+        [x["label"] for x in shapes],
+        [x.get("shape_type") or "polygon" for x in shapes],
+        [-1 if x.get("group_id") is None else int(x["group_id"]) for x in shapes],
+        coords,
+    )
+
+
+class LabelmeDataset(object):
+    """
+    A whole LabelMe directory loaded in parallel into packed arrays.
+
+    Shape `i` has points `coords[offsets[i]:offsets[i + 1]]`, label
+    `label_names[shape_labels[i]]`, type `shape_type_names[shape_types[i]]`
+    and belongs to image `shape_images[i]`. Shapes of image `j` are
+    `image_offsets[j]` to `image_offsets[j + 1]`. All shape types are kept,
+    see `polygon` to rasterize rectangles and circles.
+
+    Args:
+        source(str | List[str]): directory scanned for `.json` files, or the files.
+        max_workers(int): number of workers, one process per CPU by default.
+        backend(str): `process` or `thread`, see `utils.iter_parallel`.
+
+    Usage:
+      >>> dataset = LabelmeDataset("labelme/", max_workers=16)
+      >>> contours = dataset.contours(0)
+    """
+
+    def __init__(
+        self,
+        source: Union[str, List[str]],
+        max_workers: int = None,
+        backend: str = "process",
+        chunksize: int = 64,
+        progress: bool = True,
+    ) -> None:
+        if isinstance(source, str):
+            source = list(scan_files(source, ".json", sort=True))
+        self.ann_files = list(source)
+
+        results = iter_parallel(
+            _load_labelme,
+            [(x,) for x in self.ann_files],
+            max_workers=max_workers,
+            backend=backend,
+            chunksize=chunksize,
+            progress=progress,
+        )
+        self.image_paths = []
+        image_sizes, shape_counts, point_counts, coords = [], [], [], []
+        labels, types, group_ids = [], [], []
+        for image_path, image_size, shape_labels, shape_types, shape_groups, shape_coords in results:
+            self.image_paths.append(image_path)
+            image_sizes.append(image_size)
+            shape_counts.append(len(shape_labels))
+            labels.extend(shape_labels)
+            types.extend(shape_types)
+            group_ids.extend(shape_groups)
+            point_counts.extend(len(x) for x in shape_coords)
+            coords.extend(shape_coords)
+
+        self.image_sizes = np.array(image_sizes, dtype=np.int32).reshape(-1, 2)
+        self.image_offsets = np.concatenate([[0], np.cumsum(shape_counts, dtype=np.int64)])
+        self.shape_images = np.repeat(np.arange(len(shape_counts), dtype=np.int32), shape_counts)
+        self.offsets = np.concatenate([[0], np.cumsum(point_counts, dtype=np.int64)])
+        self.coords = np.concatenate(coords, axis=0) if coords else np.zeros((0, 2), np.float32)
+        self.group_ids = np.array(group_ids, dtype=np.int64)
+
+        self.label_names = list(dict.fromkeys(labels))
+        label_ids = {x: i for i, x in enumerate(self.label_names)}
+        self.shape_labels = np.array([label_ids[x] for x in labels], dtype=np.int32)
+        self.shape_type_names = list(dict.fromkeys(types))
+        type_ids = {x: i for i, x in enumerate(self.shape_type_names)}
+        self.shape_types = np.array([type_ids[x] for x in types], dtype=np.int8)
+
+    def image_file(self, image_idx: int) -> str:
+        """
+        Image path resolved against its annotation file.
+        """
+        ann_dir = os.path.dirname(self.ann_files[image_idx])
+        return os.path.normpath(os.path.join(ann_dir, self.image_paths[image_idx]))
+
+    def shapes_of(self, image_idx: int) -> range:
+        return range(self.image_offsets[image_idx], self.image_offsets[image_idx + 1])
+
+    def points(self, shape_idx: int) -> np.ndarray:
+        return self.coords[self.offsets[shape_idx] : self.offsets[shape_idx + 1]]
+
+    def shape_type(self, shape_idx: int) -> str:
+        return self.shape_type_names[self.shape_types[shape_idx]]
+
+    def label_name(self, shape_idx: int) -> str:
+        return self.label_names[self.shape_labels[shape_idx]]
+
+    def polygon(self, shape_idx: int, circle_points: int = 32) -> np.ndarray:
+        return shape_to_polygon(self.shape_type(shape_idx), self.points(shape_idx), circle_points)
+
+    def contours(
+        self, image_idx: int, shape_types: Tuple[str, ...] = ("polygon", "rectangle", "circle")
+    ) -> List[np.ndarray]:
+        """
+        int32 contours of an image, like `Annotation.contours` but also
+        covering rectangles and circles by default.
+        """
+        return [
+            self.polygon(i).astype(np.int32)
+            for i in self.shapes_of(image_idx)
+            if self.shape_type(i) in shape_types
+        ]
+
+    def __len__(self) -> int:
+        return len(self.ann_files)
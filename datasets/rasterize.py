@@ -0,0 +1,222 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+from filesystem import write_json_file
+from utils import iter_parallel
+
+# (label name, polygons of the instance, iscrowd)
+Shape = Tuple[str, List[np.ndarray], bool]
+# (name, height, width, shapes)
+Frame = Tuple[str, int, int, List[Shape]]
+
+FILL_SHAPE_TYPES = ("polygon", "rectangle", "circle")
+
+
+def cvat_frames(project, only_annotated: bool = False) -> Iterator[Frame]:
+    """
+    Frames of a `cvat_parser.ProjectInstance`, grouped polygons forming one shape.
+    Works with streaming projects since images are read one at a time.
+    """
+    for image in project.iter_images(only_annotated=only_annotated):
+        shapes = [(ann.label_name, ann.points, ann.iscrowd) for ann in image.annotations]
+        yield image.name, image.height, image.width, shapes
+
+
+def labelme_frames(dataset, root: str = None, image_names: bool = False) -> Iterator[Frame]:
+    """
+    Frames of a `labelme_parser.LabelmeDataset`, named after the annotation
+    files relative to `root`, or after their `imagePath` with `image_names`.
+    Shapes sharing a label and a group id are one instance; only polygons,
+    rectangles and circles are filled.
+    """
+    root = root or os.path.commonpath([os.path.dirname(x) for x in dataset.ann_files])
+    for idx in range(len(dataset)):
+        shapes, groups = [], {}
+        for i in dataset.shapes_of(idx):
+            if dataset.shape_type(i) not in FILL_SHAPE_TYPES:
+                continue
+            label, group_id = dataset.label_name(i), int(dataset.group_ids[i])
+            polygon = dataset.polygon(i)
+            if group_id < 0:
+                shapes.append((label, [polygon], False))
+            elif (label, group_id) in groups:
+                shapes[groups[(label, group_id)]][1].append(polygon)
+            else:
+                groups[(label, group_id)] = len(shapes)
+                shapes.append((label, [polygon], False))
+        height, width = dataset.image_sizes[idx]
+        if image_names:
+            name = dataset.image_paths[idx]
+        else:
+            name = os.path.relpath(dataset.ann_files[idx], root)
+        yield name, int(height), int(width), shapes
+
+
+def fill_polygons(mask: np.ndarray, polygons: List[np.ndarray], values: List[int]) -> np.ndarray:
+    """
+    Paint polygons in order, the last one winning where they overlap.
+
+    Each polygon gets its own `fillPoly` call: one call with several polygons
+    XORs their overlaps, which punches holes into grouped polygons.
+
+    Args:
+        mask(np.ndarray): 2d mask painted in place.
+        polygons(List[np.ndarray]): `(K, 2)` int32 vertices of each polygon.
+        values(List[int]): value of each polygon.
+    """
+    for polygon, value in zip(polygons, values):
+        if len(polygon):
+            cv2.fillPoly(mask, [polygon], int(value))
+    return mask
+
+
+def _split_shapes(
+    shapes: List[Shape], label_ids: Dict[str, int], crowd_ignore: bool
+) -> Tuple[List[Shape], List[Shape]]:
+    shapes = [x for x in shapes if x[0] in label_ids]
+    if not crowd_ignore:
+        return shapes, []
+    return [x for x in shapes if not x[2]], [x for x in shapes if x[2]]
+
+
+def render_semantic(
+    shapes: List[Shape],
+    height: int,
+    width: int,
+    label_ids: Dict[str, int],
+    background: int = 0,
+    ignore_value: int = 255,
+    crowd_ignore: bool = True,
+    dtype: np.dtype = np.uint8,
+) -> np.ndarray:
+    """
+    Semantic mask where each pixel holds the id of the last shape covering it.
+
+    Args:
+        shapes(List[Shape]): `(label, polygons, iscrowd)` in painting order.
+        label_ids(Dict[str, int]): label -> id, other labels are skipped.
+        crowd_ignore(bool): paint crowd shapes with `ignore_value`, on top of the others.
+    """
+    mask = np.zeros((height, width), dtype=dtype)
+    if background:
+        mask.fill(background)
+    regular, crowd = _split_shapes(shapes, label_ids, crowd_ignore)
+    polygons, values = [], []
+    for label, parts, _ in regular:
+        polygons.extend(np.asarray(x, dtype=np.int32) for x in parts)
+        values.extend([label_ids[label]] * len(parts))
+    for _, parts, _ in crowd:
+        polygons.extend(np.asarray(x, dtype=np.int32) for x in parts)
+        values.extend([ignore_value] * len(parts))
+    return fill_polygons(mask, polygons, values)
+
+
+def render_instances(
+    shapes: List[Shape],
+    height: int,
+    width: int,
+    label_ids: Dict[str, int],
+    ignore_value: int = 65535,
+    crowd_ignore: bool = True,
+    dtype: np.dtype = np.uint16,
+) -> Tuple[np.ndarray, List[int]]:
+    """
+    Instance mask with ids from 1 in painting order, 0 being background.
+
+    Returns:
+        the mask and the label id of each instance, `labels[i - 1]` for instance `i`.
+    """
+    mask = np.zeros((height, width), dtype=dtype)
+    regular, crowd = _split_shapes(shapes, label_ids, crowd_ignore)
+    polygons, values, labels = [], [], []
+    for instance_id, (label, parts, _) in enumerate(regular, 1):
+        polygons.extend(np.asarray(x, dtype=np.int32) for x in parts)
+        values.extend([instance_id] * len(parts))
+        labels.append(label_ids[label])
+    if len(labels) >= ignore_value:
+        raise ValueError(f"Too many instances for ignore value {ignore_value}: {len(labels)}")
+    for _, parts, _ in crowd:
+        polygons.extend(np.asarray(x, dtype=np.int32) for x in parts)
+        values.extend([ignore_value] * len(parts))
+    return fill_polygons(mask, polygons, values), labels
+
+
+def _render_png(frame: Frame, label_ids: Dict[str, int], mode: str, options: dict) -> tuple:
+    name, height, width, shapes = frame
+    labels = None
+    if mode == "semantic":
+        mask = render_semantic(shapes, height, width, label_ids, **options)
+    elif mode == "instance":
+        mask, labels = render_instances(shapes, height, width, label_ids, **options)
+    else:
+        raise ValueError(f"Unsupported mode: {mode}")
+    ok, data = cv2.imencode(".png", mask)
+    if not ok:
+        raise RuntimeError(f"Failed to encode mask of {name}")
+    return os.path.splitext(name)[0] + ".png", data.tobytes(), labels
+
+
+def _write_bytes(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def write_masks(
+    frames: Iterable[Frame],
+    out_dir: str,
+    label_ids: Dict[str, int],
+    mode: str = "semantic",
+    max_workers: int = None,
+    writers: int = 4,
+    chunksize: int = 16,
+    progress: bool = True,
+    **options,
+) -> List[str]:
+    """
+    Render and PNG-encode masks in worker processes while threads write the
+    encoded files, so rendering, encoding and disk I/O overlap.
+
+    In `instance` mode the label ids of each mask are saved to
+    `instances.json` in `out_dir`, keyed by mask path relative to `out_dir`.
+
+    Args:
+        frames(Iterable[Frame]): e.g. `cvat_frames(project)` or `labelme_frames(dataset)`,
+            consumed lazily.
+        mode(str): `semantic` or `instance`.
+        options: forwarded to `render_semantic` / `render_instances`.
+
+    Usage:
+      >>> write_masks(cvat_frames(ProjectInstance(file, streaming=True)), "masks/", {"car": 1})
+    """
+    results = iter_parallel(
+        _render_png,
+        ((frame, label_ids, mode, options) for frame in frames),
+        max_workers=max_workers,
+        backend="process",
+        chunksize=chunksize,
+        ordered=False,
+        progress=progress,
+    )
+    paths, instances = [], {}
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        pending = deque()
+        for name, data, labels in results:
+            path = os.path.join(out_dir, name)
+            pending.append(executor.submit(_write_bytes, path, data))
+            while len(pending) > 4 * writers or (pending and pending[0].done()):
+                pending.popleft().result()
+            paths.append(path)
+            if labels is not None:
+                instances[name] = labels
+        for future in pending:
+            future.result()
+
+    if mode == "instance":
+        write_json_file(os.path.join(out_dir, "instances.json"), instances)
+    return paths
@@ -12,29 +12,78 @@ def sigmoid_remap(x: np.ndarray, mean: Union[int, float], radius: Union[int, flo
     return 2 * (sigmoid(x - mean) - 0.5) * radius + mean
 
 
+class Compose(object):
+    """
+    Chain transforms, each called as `transform(img, mask)` or `transform(img)`.
+
+    Usage:
+      >>> transform = Compose([White2Colour(100), White2Colour(20)])
+      >>> img = transform(img)
+    """
+
+    def __init__(self, transforms: list):
+        self.transforms = list(transforms)
+
+    def __call__(self, img, mask=None):
+        for transform in self.transforms:
+            img = transform(img) if mask is None else transform(img, mask)
+        return img
+
+
 class White2Colour(object):
+    """
+    Remap hue and saturation through lookup tables built from `sigmoid_remap`,
+    so the output matches the per-pixel formula exactly.
+    """
+
     def __init__(self, hue_mean: int, hue_range: int = 5):
         self.hue_mean = hue_mean
         self.hue_range = hue_range
+        self.__lut = None
+        self.__lut_key = None
+
+    @property
+    def lut(self) -> np.ndarray:
+        """
+        `(1, 256, 3)` uint8 table for `cv2.LUT` over HSV, value left as is.
+        """
+        key = (self.hue_mean, self.hue_range)
+        if self.__lut is None or self.__lut_key != key:
+            levels = np.arange(256, dtype=np.uint8)
+            with np.errstate(over="ignore"):
+                new_hue = sigmoid_remap(levels, self.hue_mean, self.hue_range).astype(np.uint8)
+            new_sut = (6 * levels).clip(180, 230)
+            self.__lut = np.stack([new_hue, new_sut, levels], axis=-1).reshape(1, 256, 3)
+            self.__lut_key = key
+        return self.__lut
 
     def __call__(self, img, mask=None):
         """
         Args:
-            img(np.ndarray): image in BGR colorspace
-            mask(np.ndarray): bool mask
+            img(np.ndarray): image in BGR colorspace, `(H, W, 3)` or a `(N, H, W, 3)` batch
+            mask(np.ndarray): bool mask, `(H, W)` or `(N, H, W)`
         """
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        new_hue = sigmoid_remap(hsv[..., 0], self.hue_mean, self.hue_range).astype(
-            np.uint8
-        )
-        new_sut = (6 * hsv[..., 1]).clip(180, 230)
-
-        if mask:
-            hsv[..., 0] = np.logical_not(mask) * hsv[..., 0] + mask * new_hue
-            hsv[..., 1] = np.logical_not(mask) * hsv[..., 1] + mask * new_sut
+        shape = img.shape
+        if img.ndim not in (3, 4) or shape[-1] != 3:
+            raise ValueError(f"Expected a BGR image (H, W, 3) or batch (N, H, W, 3), got {shape}")
+        # colour conversions are per pixel, so a batch is converted as one tall image
+        hsv = cv2.cvtColor(img.reshape(-1, *shape[-2:]), cv2.COLOR_BGR2HSV)
+        if mask is not None:
+            mask = np.ascontiguousarray(mask, dtype=bool).reshape(hsv.shape[:2]).view(np.uint8)
+            cv2.copyTo(cv2.LUT(hsv, self.lut), mask, hsv)
         else:
-            hsv[..., 0] = new_hue
-            hsv[..., 1] = new_sut
+            cv2.LUT(hsv, self.lut, dst=hsv)
 
-        img = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-        return img
+        img = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR, dst=hsv)
+        return img.reshape(shape)
+
+    def apply_many(self, images, masks=None):
+        """
+        Args:
+            images(Union[np.ndarray, List[np.ndarray]]): `(N, H, W, 3)` batch or a list of images
+            masks(Union[np.ndarray, List[np.ndarray]]): bool masks aligned with images
+        """
+        if isinstance(images, np.ndarray):
+            return self(images, masks)
+        masks = [None] * len(images) if masks is None else masks
+        return [self(img, mask) for img, mask in zip(images, masks)]
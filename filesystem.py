@@ -1,46 +1,440 @@
 import os
+import re
 import json
-from glob import glob
-from typing import Union, List, Dict
+import mmap
+import sqlite3
+from fnmatch import fnmatch
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Union, List, Dict, Tuple, Any, Callable, Iterable, Iterator, Pattern
 
+from utils import iter_parallel
 
-def make_dataset(root: str, ext: str = None, followlinks: bool = False):
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json is used instead
+    orjson = None
+
+
+def _make_filter(
+    exts: Union[str, Tuple[str, ...], None],
+    pattern: Union[str, List[str], None],
+    regex: Union[str, Pattern, None],
+) -> Callable[[str, str], bool]:
+    exts = tuple(exts) if isinstance(exts, (list, set)) else exts
+    patterns = [pattern] if isinstance(pattern, str) else pattern
+    regex = re.compile(regex) if isinstance(regex, str) else regex
+
+    def accept(name: str, path: str) -> bool:
+        if exts is not None and not name.endswith(exts):
+            return False
+        if patterns is not None and not any(fnmatch(name, p) for p in patterns):
+            return False
+        if regex is not None and regex.search(path) is None:
+            return False
+        return True
+
+    return accept
+
+
+def _iter_dir(
+    path: str, accept: Callable, followlinks: bool, with_stat: bool, sort: bool, subdirs: List[str]
+) -> Iterator[Union[str, Tuple[str, os.stat_result]]]:
+    """
+    Yield the matched files of one directory as they are listed, collecting
+    its sub directories into `subdirs`, like one `os.walk` step.
+    """
+    try:
+        it = os.scandir(path)
+    except OSError:  # unreadable or vanished, skipped like os.walk does
+        return
+    with it:
+        if sort:
+            try:
+                it = iter(sorted(it, key=lambda e: e.name))
+            except OSError:
+                return
+        while True:
+            try:
+                entry = next(it)
+            except (StopIteration, OSError):
+                return
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if followlinks or not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif accept(entry.name, entry.path):
+                if with_stat:
+                    try:
+                        yield entry.path, entry.stat()
+                    except OSError:  # dangling link
+                        continue
+                else:
+                    yield entry.path
+
+
+def _scan_dir(path: str, accept: Callable, followlinks: bool, with_stat: bool, sort: bool):
+    """
+    List one directory -> (matched files, sub directories), for thread workers.
+    """
+    subdirs = []
+    files = list(_iter_dir(path, accept, followlinks, with_stat, sort, subdirs))
+    return files, subdirs
+
+
+def scan_files(
+    root: str,
+    exts: Union[str, Tuple[str, ...]] = None,
+    pattern: Union[str, List[str]] = None,
+    regex: Union[str, Pattern] = None,
+    followlinks: bool = False,
+    with_stat: bool = False,
+    workers: int = 1,
+    sort: bool = False,
+) -> Iterator[Union[str, Tuple[str, os.stat_result]]]:
     """
+    Lazily yield files under root, built on `os.scandir`.
+
     Args:
         root(str): file directory for scaning files.
-        ext(str): extention name of target files, like `.jpg`.
+        exts(str | tuple): extention name(s) of target files, like `.jpg` or `(".jpg", ".png")`.
+        pattern(str | list): glob pattern(s) matched against file names, like `*_mask.png`.
+        regex(str | Pattern): regular expression searched in full file paths.
         followlinks(bool): whether scan files under a filelink, default False.
+        with_stat(bool): yield `(path, stat_result)` instead of path. The stat
+            comes from the directory entry, which is free on Windows and cached otherwise.
+        workers(int): number of threads listing directories concurrently, worth it on
+            high-latency filesystems like NFS.
+        sort(bool): yield in a deterministic order. With `workers > 1` this
+            collects every result before yielding.
     """
-    file_list = []
-    for root, _, files in os.walk(root, followlinks=followlinks):
-        for file in files:
-            if ext is None or file.endswith(ext):
-                file_list.append(os.path.join(root, file))
-    return file_list
+    accept = _make_filter(exts, pattern, regex)
+    scan = partial(_scan_dir, accept=accept, followlinks=followlinks, with_stat=with_stat, sort=sort)
+
+    if workers <= 1:
+        stack = [root]
+        while stack:
+            subdirs = []
+            # yields while listing, so a huge flat directory streams from its first entry
+            yield from _iter_dir(stack.pop(), accept, followlinks, with_stat, sort, subdirs)
+            stack.extend(reversed(subdirs))
+        return
+
+    if sort:
+        results = list(scan_files(root, exts, pattern, regex, followlinks, with_stat, workers))
+        results.sort(key=lambda x: x[0] if with_stat else x)
+        yield from results
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(scan, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                pending.update(executor.submit(scan, d) for d in subdirs)
+                yield from files
 
 
-def sync_rm(source_dir: str, target_dir: str, strict: bool = False):
+def make_dataset(root: str, ext: Union[str, Tuple[str, ...]] = None, followlinks: bool = False):
+    """
+    Args:
+        root(str): file directory for scaning files.
+        ext(str | tuple): extention name(s) of target files, like `.jpg`.
+        followlinks(bool): whether scan files under a filelink, default False.
+
+    See `scan_files` for a lazy, filtered or multi-threaded scan.
+    """
+    return list(scan_files(root, ext, followlinks=followlinks))
+
+
+def _relative_files(root: Union[str, "FileIndex"]) -> List[str]:
+    if isinstance(root, FileIndex):
+        root.refresh()
+        return root.relpaths()
+    assert os.path.exists(root)
+    prefix = os.path.join(root, "")
+    return [path[len(prefix):] for path in scan_files(root)]
+
+
+def _stems(relpath: str) -> List[str]:
+    """
+    Every `stem` such that `stem.*` matches relpath, e.g. `a/b.c.png` -> `a/b`, `a/b.c`.
+    """
+    start = len(relpath) - len(os.path.basename(relpath))
+    return [relpath[:i] for i in range(start, len(relpath)) if relpath[i] == "."]
+
+
+def sync_rm(
+    source_dir: Union[str, "FileIndex"],
+    target_dir: Union[str, "FileIndex"],
+    strict: bool = False,
+    dry_run: bool = False,
+    workers: int = 8,
+) -> List[str]:
     """
     Remove files under target dir if without corresponding files under source dir.
 
+    Both trees are listed once and compared as sets of relative paths.
+
     Args:
-        soruce_dir(str): source ffile directory as benchmark.
-        target_dir(str): target file directory to be checked.
-        strict(bool): True means files must match includes extention name.
+        soruce_dir(str | FileIndex): source ffile directory as benchmark.
+        target_dir(str | FileIndex): target file directory to be checked.
+            A `FileIndex` is refreshed and diffed instead of walking its tree.
+        strict(bool): True means files must match includes extention name,
+            otherwise `a/b.png` is kept if any `a/b.*` exists under source dir.
+        dry_run(bool): only report files which would be removed.
+        workers(int): number of threads deleting files.
+
+    Returns:
+        List[str]: removed files, or files to be removed in dry-run mode.
     """
-    assert os.path.exists(source_dir) and os.path.exists(target_dir)
+    source_list = _relative_files(source_dir)
+    target_list = _relative_files(target_dir)
+    if isinstance(target_dir, FileIndex):
+        target_dir = target_dir.root
+    assert os.path.exists(target_dir)
+    if strict:
+        found = set(source_list)
+        redundant = [rel for rel in target_list if rel not in found]
+    else:
+        found = set(stem for rel in source_list for stem in _stems(rel))
+        redundant = [rel for rel in target_list if os.path.splitext(rel)[0] not in found]
+    redundant = [os.path.join(target_dir, rel) for rel in redundant]
+
+    if dry_run:
+        print(
+            "[dry-run] %d of %d files under %s would be removed"
+            % (len(redundant), len(target_list), target_dir)
+        )
+        return redundant
 
-    target_list = make_dataset(target_dir)
-    for target_file in target_list:
-        source_file = target_file.replace(target_dir, source_dir)
-        if strict:
-            found_list = [source_file] if os.path.exists(source_file) else []
+    results = iter_parallel(
+        os.remove,
+        [(path,) for path in redundant],
+        max_workers=workers,
+        chunksize=256,
+        return_exceptions=True,
+        progress=False,
+    )
+    removed = []
+    for path, result in zip(redundant, results):
+        if isinstance(result, Exception):
+            print("Failed to remove %s: %s" % (path, result))
         else:
-            source_file = os.path.splitext(source_file)[0] + ".*"
-            found_list = glob(source_file)
+            removed.append(path)
+    return removed
+
+
+class FileIndex(object):
+    """
+    Persistent index of the files under root, stored in SQLite next to the tree.
+
+    `refresh` only re-lists directories whose mtime changed since the last
+    scan, so repeated scans of a huge, mostly static tree are cheap. Note a
+    directory mtime only changes when entries are added, removed or renamed:
+    pass `full=True` to also pick up files rewritten in place.
+
+    The index defaults to `<root>.file_index.sqlite`, beside root rather than
+    inside it: SQLite journal files would otherwise touch root's mtime on every
+    commit and show up in `make_dataset`/`sync_rm` listings.
+
+    Usage:
+      >>> index = FileIndex("/data/images")
+      >>> index.refresh()
+      >>> jpgs = index.query(exts=".jpg", prefix="train/")
+    """
+
+    NAME = ".file_index.sqlite"
+
+    def __init__(self, root: str, path: str = None, followlinks: bool = False):
+        self.root = root
+        self.path = path or os.path.normpath(os.path.abspath(root)) + self.NAME
+        self.followlinks = followlinks
+        # an index placed inside the tree by hand is still kept out of it
+        location = os.path.relpath(os.path.dirname(os.path.abspath(self.path)), root)
+        self.__own_dir = None if location.startswith("..") else location.replace(os.sep, "/")
+        self.__own_name = os.path.basename(self.path)
+        self.__conn = sqlite3.connect(self.path)
+        self.__conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime_ns INTEGER);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+            """
+        )
+
+    def __abspath(self, relpath: str) -> str:
+        return os.path.join(self.root, relpath) if relpath else self.root
+
+    @staticmethod
+    def __join(parent: str, name: str) -> str:
+        return parent + "/" + name if parent else name
 
-        if len(found_list) == 0:
-            os.remove(target_file)
+    def __drop_tree(self, relpath: str) -> None:
+        if not relpath:
+            self.__conn.execute("DELETE FROM dirs")
+            self.__conn.execute("DELETE FROM files")
+            return
+        # "a/..." paths sort between "a/" and "a0" ("0" follows "/")
+        bounds = (relpath, relpath + "/", relpath + "0")
+        self.__conn.execute("DELETE FROM dirs WHERE path = ? OR (path > ? AND path < ?)", bounds)
+        self.__conn.execute("DELETE FROM files WHERE dir = ? OR (dir > ? AND dir < ?)", bounds)
+
+    def __list(self, relpath: str) -> Tuple[list, List[str]]:
+        files, subdirs = [], []
+        own_dir = relpath == self.__own_dir or (not relpath and self.__own_dir == ".")
+        with os.scandir(self.__abspath(relpath)) as it:
+            for entry in it:
+                if own_dir and entry.name.startswith(self.__own_name):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if self.followlinks or not entry.is_symlink():
+                        subdirs.append(self.__join(relpath, entry.name))
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:  # dangling link
+                    continue
+                files.append((self.__join(relpath, entry.name), relpath, st.st_size, st.st_mtime_ns))
+        return files, subdirs
+
+    def refresh(self, full: bool = False) -> int:
+        """
+        Bring the index up to date with the tree.
+
+        Args:
+            full(bool): re-list every directory, ignoring stored mtimes.
+
+        Returns:
+            int: number of directories re-listed.
+        """
+        conn, relisted = self.__conn, 0
+        stack = [""]
+        while stack:
+            relpath = stack.pop()
+            try:
+                # taken before listing, so changes made meanwhile show up next time
+                mtime_ns = os.stat(self.__abspath(relpath)).st_mtime_ns
+            except OSError:
+                self.__drop_tree(relpath)
+                continue
+
+            known = [row[0] for row in conn.execute("SELECT path FROM dirs WHERE parent = ?", (relpath,))]
+            row = conn.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (relpath,)).fetchone()
+            if not full and row is not None and row[0] == mtime_ns:
+                stack.extend(known)
+                continue
+
+            try:
+                files, subdirs = self.__list(relpath)
+            except OSError:
+                self.__drop_tree(relpath)
+                continue
+            relisted += 1
+            for gone in set(known) - set(subdirs):
+                self.__drop_tree(gone)
+            conn.execute("DELETE FROM files WHERE dir = ?", (relpath,))
+            conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", files)
+            parent = os.path.dirname(relpath) if relpath else None
+            conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", (relpath, parent, mtime_ns))
+            stack.extend(subdirs)
+        conn.commit()
+        return relisted
+
+    def query(
+        self,
+        exts: Union[str, Tuple[str, ...]] = None,
+        prefix: str = None,
+        with_stat: bool = False,
+        relative: bool = False,
+    ) -> List[Union[str, Tuple[str, int, int]]]:
+        """
+        Indexed files sorted by path, as of the last `refresh`.
+
+        Args:
+            exts(str | tuple): extention name(s) of target files, like `.jpg`.
+            prefix(str): relative path prefix, like `train/` or `train/cat_`.
+            with_stat(bool): return `(path, size, mtime_ns)` tuples instead of paths.
+            relative(bool): return paths relative to root.
+        """
+        sql, params = "SELECT path, size, mtime_ns FROM files", []
+        if prefix:
+            upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            sql += " WHERE path >= ? AND path < ?"
+            params = [prefix, upper]
+        exts = tuple(exts) if isinstance(exts, (list, set)) else exts
+
+        results = []
+        for path, size, mtime_ns in self.__conn.execute(sql + " ORDER BY path", params):
+            if exts is not None and not path.endswith(exts):
+                continue
+            path = path if relative else os.path.join(self.root, path)
+            results.append((path, size, mtime_ns) if with_stat else path)
+        return results
+
+    def relpaths(self) -> List[str]:
+        return [row[0] for row in self.__conn.execute("SELECT path FROM files ORDER BY path")]
+
+    def close(self) -> None:
+        self.__conn.close()
+
+    def __enter__(self) -> "FileIndex":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.__conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+def _json_loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:  # e.g. NaN or huge ints, stdlib accepts them
+            pass
+    return json.loads(data)
+
+
+def _reject(obj: Any) -> Any:
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def json_dumps(data: Any, indent: int = None) -> bytes:
+    """
+    Serialize to UTF-8 JSON, compact unless indent is given.
+
+    `orjson` is used when installed. Types stdlib `json` rejects, like
+    datetimes, dataclasses and str/int/dict/list subclasses, are passed back
+    to stdlib, which serializes or rejects them the same way on every machine.
+    orjson writes NaN/Infinity as null, so output containing null is redone
+    by stdlib too. What still differs with orjson:
+      - float spelling, e.g. `1e16` instead of `1e+16`, for the same value;
+      - `uuid.UUID` and `enum.Enum` values, which orjson writes as strings /
+        their value where stdlib raises TypeError.
+    """
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        option |= orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+        option |= orjson.OPT_INDENT_2 if indent == 2 else 0
+        try:
+            result = orjson.dumps(data, option=option, default=_reject)
+        except TypeError:  # unsupported by orjson, let stdlib try or raise
+            result = None
+        if result is not None and b"null" not in result:
+            return result
+    separators = (",", ":") if indent is None else None
+    return json.dumps(data, indent=indent, separators=separators, ensure_ascii=False).encode("utf-8")
 
 
 def read_text_file(path: str) -> list:
@@ -52,37 +446,96 @@ def read_text_file(path: str) -> list:
     return [line.strip() for line in lines]
 
 
+def iter_text_file(path: str, use_mmap: bool = False) -> Iterator[str]:
+    """
+    Lazily yield stripped lines of a text file.
+
+    Args:
+        use_mmap(bool): read through a memory map, which spares the copies of
+            buffered reads on multi-GB files.
+    """
+    if not use_mmap or os.path.getsize(path) == 0:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield line.strip()
+        return
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line in iter(mm.readline, b""):
+            yield line.decode("utf-8").strip()
+
+
 def write_text_file(path: str, lines: list, mode: str = "w") -> None:
     with open(path, mode=mode, encoding="utf-8") as f:
         f.write("\n".join(lines) + "\n")
 
 
 def read_json_file(path: str) -> dict:
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        data = _json_loads(f.read())
     return data
 
 
-def write_json_file(path: str, data: dict, mode: str = "w", indent: int = 4) -> None:
-    with open(path, mode=mode, encoding="utf-8") as f:
-        json.dump(data, f, indent=indent)
+def write_json_file(path: str, data: dict, mode: str = "w", indent: int = None) -> None:
+    """
+    Write compact JSON by default, through `orjson` when it is installed.
+    """
+    with open(path, mode=mode.replace("b", "") + "b") as f:
+        f.write(json_dumps(data, indent))
 
 
-def read_file(path: str) -> Union[List, Dict]:
+def iter_jsonl_file(path: str) -> Iterator[Any]:
+    """
+    Lazily yield the records of a JSON Lines file, skipping blank lines.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield _json_loads(line)
+
+
+def write_jsonl_file(path: str, records: Iterable, mode: str = "w", batch_size: int = 1000) -> None:
+    """
+    Write records as JSON Lines, one `write` per `batch_size` records.
+
+    Args:
+        mode(str): `w` to overwrite or `a` to append.
+    """
+    with open(path, mode=mode.replace("b", "") + "b") as f:
+        batch = []
+        for record in records:
+            batch.append(json_dumps(record))
+            if len(batch) >= batch_size:
+                f.write(b"\n".join(batch) + b"\n")
+                batch = []
+        if batch:
+            f.write(b"\n".join(batch) + b"\n")
+
+
+def read_file(path: str, lazy: bool = False) -> Union[List, Dict, Iterator]:
+    """
+    Args:
+        lazy(bool): return a generator for `.txt` and `.jsonl` instead of a list.
+    """
     ext = os.path.splitext(path)[1]
     if ext == ".txt":
-        return read_text_file(path)
+        return iter_text_file(path) if lazy else read_text_file(path)
     elif ext == ".json":
         return read_json_file(path)
+    elif ext == ".jsonl":
+        records = iter_jsonl_file(path)
+        return records if lazy else list(records)
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
 
-def write_file(path: str, data: Union[List, Dict], mode: str = "w", **kargs) -> None:
+def write_file(path: str, data: Union[List, Dict, Iterable], mode: str = "w", **kargs) -> None:
     ext = os.path.splitext(path)[1]
     if ext == ".txt":
-        write_text_file(path, data, mode, **kargs)
+        write_text_file(path, data, mode=mode, **kargs)
     elif ext == ".json":
-        write_json_file(path, data, mode, **kargs)
+        write_json_file(path, data, mode=mode, **kargs)
+    elif ext == ".jsonl":
+        write_jsonl_file(path, data, mode=mode, **kargs)
     else:
         raise ValueError(f"Unsupported file type: {ext}")
@@ -1,7 +1,350 @@
+import os
 import json
+import hashlib
+import operator
+import sqlite3
+from bisect import bisect_left, bisect_right
+from copy import deepcopy
+from functools import reduce
 from typing import List, Tuple, Dict, Any, Union
 
-from utils import Struct
+import numpy as np
+
+from utils import Struct, Schema, Record
+
+
+_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda a, b: a in b,
+    "not in": lambda a, b: a not in b,
+    "is": operator.is_,
+    "is not": operator.is_not,
+}
+_UNARY_OPERATORS = {
+    "is None": lambda a: a is None,
+    "is not None": lambda a: a is not None,
+}
+_GROUPS = ("and", "or")
+
+
+class Condition(object):
+    """
+    A single compiled `(attri, oper, value)` test against one record.
+    """
+
+    __slots__ = ("attri", "oper", "value", "func")
+
+    def __init__(self, attri: Any, oper: str, value: Any = None) -> None:
+        self.attri = attri
+        self.oper = oper
+        self.value = value
+        if oper in _OPERATORS:
+            func = _OPERATORS[oper]
+            self.func = lambda var: func(var, value)
+        elif oper in _UNARY_OPERATORS:
+            self.func = _UNARY_OPERATORS[oper]
+        else:
+            raise ValueError(f"Unsupported operator: {oper}")
+
+    def __call__(self, record) -> bool:
+        return self.func(record[self.attri])
+
+    def __repr__(self) -> str:
+        if self.oper in _UNARY_OPERATORS:
+            return f"({self.attri!r} {self.oper})"
+        return f"({self.attri!r} {self.oper} {self.value!r})"
+
+
+class ConditionGroup(object):
+    """
+    AND/OR combination of conditions, evaluated with short-circuiting.
+    """
+
+    __slots__ = ("mode", "children")
+
+    def __init__(self, mode: str, children: List[Union[Condition, "ConditionGroup"]]):
+        assert mode in _GROUPS, f"Unsupported group: {mode}"
+        self.mode = mode
+        self.children = tuple(children)
+
+    def __call__(self, record) -> bool:
+        if self.mode == "and":
+            for child in self.children:
+                if not child(record):
+                    return False
+            return True
+        for child in self.children:
+            if child(record):
+                return True
+        return False
+
+    def __repr__(self) -> str:
+        return "(" + f" {self.mode} ".join(repr(c) for c in self.children) + ")"
+
+
+def _freeze(obj: Any) -> Any:
+    """
+    Hashable cache key keeping types apart, so `[1]`/`(1,)` or `1`/`True` differ.
+    """
+    if isinstance(obj, (list, tuple)):
+        return (type(obj), tuple(_freeze(x) for x in obj))
+    if isinstance(obj, (set, frozenset)):
+        return (type(obj), frozenset(_freeze(x) for x in obj))
+    return (type(obj), obj)
+
+
+def _is_group(cond: Any) -> bool:
+    return (
+        len(cond) == 2
+        and isinstance(cond[0], str)
+        and cond[0].lower() in _GROUPS
+        and isinstance(cond[1], (list, tuple))
+    )
+
+
+def _build(conditions: Any, mode: str = "and") -> ConditionGroup:
+    children = []
+    for cond in conditions:
+        if _is_group(cond):
+            children.append(_build(cond[1], cond[0].lower()))
+        elif len(cond) == 2:
+            if cond[1] not in _UNARY_OPERATORS:
+                raise ValueError(f"Condition {cond!r} lacks a value for a binary operator")
+            children.append(Condition(cond[0], cond[1]))
+        else:
+            children.append(Condition(*cond))
+    return ConditionGroup(mode, children)
+
+
+_PLAN_CACHE = {}
+_PLAN_CACHE_SIZE = 256
+
+
+def compile_conditions(conditions: Union[List, Tuple]) -> ConditionGroup:
+    """
+    Compile a condition list into a reusable query plan.
+
+    Items of the list are AND-ed together, each one being either:
+      - `(attri, oper, value)` with oper in `==, !=, <, <=, >, >=, in, not in, is, is not`
+      - `(attri, "is None")` / `(attri, "is not None")`
+      - `("and" | "or", [conditions...])` for nested grouping
+
+    Plans are cached, so repeated calls with equal conditions skip compiling.
+    """
+    if isinstance(conditions, ConditionGroup):
+        return conditions
+    try:
+        key = _freeze(conditions)
+        plan = _PLAN_CACHE.get(key)
+    except TypeError:  # unhashable values, e.g. a dict
+        return _build(conditions)
+
+    if plan is None:
+        if len(_PLAN_CACHE) >= _PLAN_CACHE_SIZE:
+            _PLAN_CACHE.pop(next(iter(_PLAN_CACHE)))
+        # copy so that later mutation of the caller's lists can't alter the plan
+        plan = _PLAN_CACHE[key] = _build(deepcopy(conditions))
+    return plan
+
+
+_MISSING = object()
+
+
+def _get_attri(record: Any, name: Any) -> Any:
+    if isinstance(record, Struct):
+        return record.map.get(name, _MISSING)
+    return record.get(name, _MISSING)
+
+
+def _to_record(value: Any) -> dict:
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, (Struct, Record)):
+        return value.map
+    return dict(value)
+
+
+class HashIndex(object):
+    """
+    Equality index of one attribute: value -> items, serving `==`, `in`, `is None`.
+    """
+
+    kind = "hash"
+    valid = True
+
+    def __init__(self, name: Any) -> None:
+        self.name = name
+        self.__buckets = {}  # value -> {item: None}, keeps insertion order
+
+    def build(self, table: dict) -> None:
+        self.__buckets = {}
+        for item, record in table.items():
+            self.add(item, _get_attri(record, self.name))
+
+    def add(self, item: Any, value: Any) -> None:
+        if value is _MISSING:
+            return
+        try:
+            self.__buckets.setdefault(value, {})[item] = None
+        except TypeError:  # unhashable values are left to scans
+            pass
+
+    def remove(self, item: Any, value: Any) -> None:
+        try:
+            bucket = self.__buckets.get(value)
+        except TypeError:
+            return
+        if bucket is not None:
+            bucket.pop(item, None)
+            if not bucket:
+                del self.__buckets[value]
+
+    def __values(self, cond: Condition) -> Union[list, None]:
+        if cond.oper == "==":
+            return [cond.value]
+        if cond.oper == "in":
+            # str/bytes `in` is a substring test, which buckets can't answer
+            if isinstance(cond.value, (list, tuple, set, frozenset)):
+                return list(cond.value)
+            return None
+        if cond.oper == "is None" or (cond.oper == "is" and cond.value is None):
+            return [None]
+        return None
+
+    def count(self, cond: Condition) -> Union[int, None]:
+        """
+        Number of candidates for `cond`, None if the index can't serve it.
+        """
+        values = self.__values(cond)
+        try:
+            return None if values is None else sum(
+                len(self.__buckets.get(v, ())) for v in values
+            )
+        except TypeError:
+            return None
+
+    def lookup(self, cond: Condition) -> list:
+        items = {}
+        for value in self.__values(cond):
+            items.update(self.__buckets.get(value, {}))
+        return list(items)
+
+
+def _unordered(value: Any) -> bool:
+    """
+    Values left out of sorted indexes: missing, None or NaN (`NaN != NaN`).
+    """
+    if value is _MISSING or value is None:
+        return True
+    try:
+        return bool(value != value)
+    except Exception:  # e.g. arrays, which don't compare to a single bool
+        return False
+
+
+class SortedIndex(object):
+    """
+    Range index of one attribute kept sorted with bisect, serving `==, <, <=, >, >=`.
+
+    None and NaN values are not indexed since they don't compare with others,
+    and NaN queries are left to scans. A value that doesn't compare with the
+    indexed ones marks the index invalid, leaving `select` to scan until
+    `reindex()` succeeds.
+
+    Usage:
+      >>> manager = AttriManager({"a": {"score": 0.9}, "b": {"score": float("nan")}})
+      >>> scan = manager.select([("score", ">", 0.5)])
+      >>> manager.create_index("score", "sorted")
+      >>> manager.select([("score", ">", 0.5)]) == scan
+      True
+    """
+
+    kind = "sorted"
+
+    def __init__(self, name: Any) -> None:
+        self.name = name
+        self.__entries = []  # sorted (value, uid)
+        self.__items = []  # aligned with entries
+        self.__uids = {}  # item -> uid, breaks ties between equal values
+        self.valid = True
+
+    def __uid(self, item: Any) -> int:
+        return self.__uids.setdefault(item, len(self.__uids))
+
+    def build(self, table: dict) -> None:
+        pairs = []
+        for item, record in table.items():
+            value = _get_attri(record, self.name)
+            if not _unordered(value):
+                pairs.append(((value, self.__uid(item)), item))
+        try:
+            pairs.sort(key=lambda x: x[0])
+        except TypeError:
+            self.__entries, self.__items, self.valid = [], [], False
+            return
+        self.__entries = [x[0] for x in pairs]
+        self.__items = [x[1] for x in pairs]
+        self.valid = True
+
+    def add(self, item: Any, value: Any) -> None:
+        if not self.valid or _unordered(value):
+            return
+        entry = (value, self.__uid(item))
+        try:
+            idx = bisect_right(self.__entries, entry)
+        except TypeError:
+            self.__entries, self.__items, self.valid = [], [], False
+            return
+        self.__entries.insert(idx, entry)
+        self.__items.insert(idx, item)
+
+    def remove(self, item: Any, value: Any) -> None:
+        if not self.valid or _unordered(value) or item not in self.__uids:
+            return
+        entry = (value, self.__uids[item])
+        try:
+            idx = bisect_left(self.__entries, entry)
+        except TypeError:
+            return
+        if idx < len(self.__entries) and self.__entries[idx] == entry:
+            del self.__entries[idx]
+            del self.__items[idx]
+
+    def __span(self, cond: Condition) -> Union[Tuple[int, int], None]:
+        value, entries = cond.value, self.__entries
+        if cond.oper not in ("==", "<", "<=", ">", ">=") or _unordered(value):
+            return None
+        low, high = (value, -1), (value, float("inf"))
+        try:
+            if cond.oper == "==":
+                return bisect_left(entries, low), bisect_right(entries, high)
+            if cond.oper == "<":
+                return 0, bisect_left(entries, low)
+            if cond.oper == "<=":
+                return 0, bisect_right(entries, high)
+            if cond.oper == ">":
+                return bisect_right(entries, high), len(entries)
+            return bisect_left(entries, low), len(entries)
+        except TypeError:
+            return None
+
+    def count(self, cond: Condition) -> Union[int, None]:
+        if not self.valid:
+            return None
+        span = self.__span(cond)
+        return None if span is None else span[1] - span[0]
+
+    def lookup(self, cond: Condition) -> list:
+        start, stop = self.__span(cond)
+        return self.__items[start:stop]
+
+
+_INDEX_TYPES = {"hash": HashIndex, "sorted": SortedIndex}
 
 
 class AttriManager(object):
@@ -9,9 +352,11 @@ class AttriManager(object):
         if isinstance(items, dict):
             self.table = items
         elif isinstance(items, (list, tuple)):
-            self.table = {item: Struct() for item in items}
+            schema = Schema()
+            self.table = {item: Record(schema) for item in items}
         else:
             raise NotImplementedError
+        self.__indexes = {}  # (name, kind) -> index
 
     @classmethod
     def from_file(cls, path: str) -> "AttriManager":
@@ -23,39 +368,117 @@ class AttriManager(object):
         if item in self.table:
             return False
         self.table[item] = value
+        for index in self.__indexes.values():
+            index.add(item, _get_attri(value, index.name))
         return True
 
     def set_attri(self, name: Any, value: Any, items: list = None):
+        indexes = [x for x in self.__indexes.values() if x.name == name]
         if items is not None:
             for item in items:
+                for index in indexes:
+                    index.remove(item, _get_attri(self.table[item], name))
+                    index.add(item, value)
                 self.table[item][name] = value
         else:
             for k, _ in self.table.items():
                 self.table[k][name] = value
+            for index in indexes:
+                index.build(self.table)
+
+    def create_index(self, name: Any, kind: str = "hash") -> None:
+        """
+        Index attribute `name` so that `select` can skip full scans.
+
+        Args:
+            name(Any): attribute name.
+            kind(str): `hash` for `==`/`in`/`is None` lookups,
+                `sorted` for `==`/`<`/`<=`/`>`/`>=` lookups.
+
+        Indexes follow `add_item`, `set_attri` and `update`; records mutated
+        directly through `table` require calling `reindex()`.
+        """
+        if kind not in _INDEX_TYPES:
+            raise ValueError(f"Unsupported index kind: {kind}")
+        index = _INDEX_TYPES[kind](name)
+        index.build(self.table)
+        if not index.valid:
+            raise ValueError(f"Values of {name!r} are not mutually comparable")
+        self.__indexes[(name, kind)] = index
+
+    def drop_index(self, name: Any, kind: str = None) -> None:
+        for key in list(self.__indexes):
+            if key[0] == name and kind in (None, key[1]):
+                del self.__indexes[key]
 
-    def select(self, conditions: list) -> dict:
+    def reindex(self) -> None:
+        for index in self.__indexes.values():
+            index.build(self.table)
+
+    @property
+    def indexes(self) -> List[Tuple[Any, str]]:
+        return list(self.__indexes.keys())
+
+    def __choose_index(self, plan: ConditionGroup) -> Union[tuple, None]:
+        """
+        Pick the indexed top-level AND condition yielding the fewest candidates.
+        """
+        if plan.mode != "and":
+            return None
+        best = None
+        for cond in plan.children:
+            if not isinstance(cond, Condition):
+                continue
+            for kind in _INDEX_TYPES:
+                index = self.__indexes.get((cond.attri, kind))
+                count = None if index is None else index.count(cond)
+                if count is not None and (best is None or count < best[2]):
+                    best = (index, cond, count)
+        return best
+
+    def explain(self, conditions: Union[list, ConditionGroup]) -> dict:
+        """
+        Describe how `select` would run the conditions.
+        """
+        plan = compile_conditions(conditions)
+        chosen = self.__choose_index(plan)
+        if chosen is None:
+            return {"plan": repr(plan), "scan": "full", "index": None, "candidates": len(self)}
+        index, cond, count = chosen
+        return {
+            "plan": repr(plan),
+            "scan": "index",
+            "index": (index.name, index.kind),
+            "condition": repr(cond),
+            "candidates": count,
+        }
+
+    def select(self, conditions: Union[list, ConditionGroup]) -> dict:
         """
         Select items according to conditions.
 
         Conditions like:
         `[("attri1", "==", True), ("attri2", ">", 0.5), ("attri3", "==", "apple"), ...]`
+        `[("attri1", "in", [1, 2]), ("or", [("attri2", "is None"), ("attri2", "<", 0)])]`
+
+        See `compile_conditions` for the full syntax. An index (see `create_index`)
+        on one of the top-level conditions is used automatically.
         """
+        plan = compile_conditions(conditions)
+        chosen = self.__choose_index(plan)
+        if chosen is None:
+            return {k: v for k, v in self.table.items() if plan(v)}
+        index, cond, _ = chosen
         targets = {}
-        for k, v in self.table.items():
-            flag = True
-            for attri, oper, value in conditions:
-                var = "'" + v[attri] + "'" if isinstance(v[attri], str) else v[attri]
-                value = "'" + value + "'" if isinstance(value, str) else value
-                flag = flag and eval("%s%s%s" % (var, oper, value))
-                if flag is False:
-                    break
-            if flag:
+        for k in index.lookup(cond):
+            v = self.table[k]
+            if plan(v):
                 targets[k] = v
         return targets
 
     def dump(self, path: str) -> None:
         with open(path, "w") as f:
-            json.dump(self.table, f, indent=2)
+            json.dump(self.table, f, indent=2, default=_to_record)
 
     def update(self, source: Union[str, dict]) -> None:
         if isinstance(source, str):
@@ -66,6 +489,7 @@ class AttriManager(object):
             self.table = source
         else:
             raise NotImplementedError
+        self.reindex()
 
     @property
     def attri_names(self) -> List[str]:
@@ -73,3 +497,777 @@ class AttriManager(object):
 
     def __len__(self) -> int:
         return len(self.table)
+
+
+def _json_key(item: Any) -> str:
+    """
+    Item key as it reads back from a JSON object, e.g. `5` -> `"5"`.
+    """
+    if isinstance(item, str):
+        return item
+    if item is None or isinstance(item, (bool, int, float)):
+        return json.dumps(item)
+    raise TypeError(f"Item keys must be str, int, float, bool or None, not {type(item).__name__}")
+
+
+class _HashingWriter(object):
+    def __init__(self, f) -> None:
+        self.f = f
+        self.digest = hashlib.sha1()
+
+    def write(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.digest.update(data)
+        self.f.write(data)
+
+
+class JournaledAttriManager(AttriManager):
+    """
+    AttriManager persisted as a compact JSON snapshot plus an append-only
+    JSONL log of `add_item`/`set_attri` mutations, so that a checkpoint costs
+    O(changes) instead of re-dumping the whole table.
+
+    Loading replays `<path>.log` on top of the snapshot at `path`. The log
+    is folded into a new snapshot by `compact()`, called explicitly or
+    automatically once the log exceeds `compact_size` bytes. Item keys are
+    stored as strings, the way a JSON snapshot reads them back.
+
+    Usage:
+      >>> manager = JournaledAttriManager("attris.json")
+      >>> manager.set_attri("checked", True, items=["img_001"])
+      >>> manager.checkpoint()
+    """
+
+    def __init__(self, path: str, compact_size: int = 256 * 1024 * 1024) -> None:
+        self.path = path
+        self.log_path = path + ".log"
+        self.compact_size = compact_size
+
+        table, self.__snapshot = {}, None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            table, self.__snapshot = json.loads(data), hashlib.sha1(data).hexdigest()
+        super().__init__(table)
+        self.__replay()
+        self.__log = open(self.log_path, "a", encoding="utf-8")
+        self.__log_size = self.__log.tell()
+        if not self.__log_size:
+            self.__begin()
+
+    @classmethod
+    def from_file(cls, path: str) -> "JournaledAttriManager":
+        return cls(path)
+
+    def __replay(self) -> None:
+        if not os.path.exists(self.log_path):
+            return
+        valid_size = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):  # torn write at the tail
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if entry["op"] == "base" and entry["snapshot"] != self.__snapshot:
+                    break  # already folded into the snapshot by an interrupted compact()
+                if entry["op"] == "add":
+                    AttriManager.add_item(self, entry["item"], entry["value"])
+                elif entry["op"] == "set":
+                    AttriManager.set_attri(self, entry["name"], entry["value"], entry["items"])
+                valid_size += len(line)
+        # drop the torn tail so that new entries start on a clean line
+        if valid_size != os.path.getsize(self.log_path):
+            os.truncate(self.log_path, valid_size)
+
+    def __begin(self) -> None:
+        """
+        Start the log with the digest of the snapshot it applies to.
+        """
+        line = json.dumps({"op": "base", "snapshot": self.__snapshot}) + "\n"
+        self.__log.write(line)
+        self.__log_size += len(line)
+
+    def __append(self, entry: dict) -> None:
+        line = json.dumps(entry, default=_to_record) + "\n"
+        self.__log.write(line)
+        self.__log_size += len(line)
+        if self.__log_size >= self.compact_size:
+            self.compact()
+
+    def add_item(self, item, value) -> bool:
+        item = _json_key(item)
+        added = super().add_item(item, value)
+        if added:
+            self.__append({"op": "add", "item": item, "value": value})
+        return added
+
+    def set_attri(self, name: Any, value: Any, items: list = None):
+        items = [_json_key(x) for x in items] if items is not None else None
+        super().set_attri(name, value, items)
+        self.__append({"op": "set", "name": name, "value": value, "items": items})
+
+    def update(self, source: Union[str, dict]) -> None:
+        super().update(source)
+        self.compact()
+
+    def checkpoint(self) -> None:
+        """
+        Make every mutation so far durable by syncing the log.
+        """
+        self.__log.flush()
+        os.fsync(self.__log.fileno())
+
+    def compact(self) -> None:
+        """
+        Write a fresh snapshot and truncate the log.
+
+        The log names the snapshot it applies to, so after a crash between
+        both steps the stale log is dropped instead of replayed twice.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            writer = _HashingWriter(f)
+            json.dump(self.table, writer, default=_to_record, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.__snapshot = writer.digest.hexdigest()
+
+        self.__log.close()
+        self.__log = open(self.log_path, "w", encoding="utf-8")
+        self.__log_size = 0
+        self.__begin()
+
+    def dump(self, path: str = None) -> None:
+        if path is None or os.path.abspath(path) == os.path.abspath(self.path):
+            self.checkpoint()
+        else:
+            super().dump(path)
+
+    def close(self) -> None:
+        self.checkpoint()
+        self.__log.close()
+
+    def __enter__(self) -> "JournaledAttriManager":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+_FILL_VALUES = {
+    np.dtype(bool): False,
+    np.dtype(np.int64): 0,
+    np.dtype(np.float64): np.nan,
+    np.dtype(object): None,
+}
+_VECTORIZED_OPERATORS = ("==", "!=", "<", "<=", ">", ">=")
+
+
+def _infer_dtype(value: Any) -> np.dtype:
+    if isinstance(value, (bool, np.bool_)):
+        return np.dtype(bool)
+    if isinstance(value, (int, np.integer)):
+        # ints beyond int64 are kept exact as python objects
+        return np.dtype(np.int64) if -(2**63) <= value < 2**63 else np.dtype(object)
+    if isinstance(value, (float, np.floating)):
+        return np.dtype(np.float64)
+    return np.dtype(object)
+
+
+def _promote(dtype_a: np.dtype, dtype_b: np.dtype) -> np.dtype:
+    # no int -> float64 upcast, it would read back 1 as 1.0
+    return dtype_a if dtype_a == dtype_b else np.dtype(object)
+
+
+class ColumnarAttriManager(AttriManager):
+    """
+    AttriManager keeping one typed NumPy array per attribute.
+
+    bool/int/float attributes live in `bool`/`int64`/`float64` arrays, anything
+    else in object arrays, as are attributes mixing these types, so values read
+    back exactly as written.
+    `select` evaluates conditions as boolean masks and `set_attri` becomes
+    slice assignment. Items missing an attribute never match a condition on it.
+
+    Usage:
+      >>> manager = ColumnarAttriManager.from_file("attris.json")
+      >>> manager.set_attri("split", "train")
+      >>> keys = manager.select_keys([("score", ">", 0.5)])
+    """
+
+    def __init__(self, items: Union[List, Tuple, Dict]) -> None:
+        self.__load(items)
+
+    def __load(self, items: Union[List, Tuple, Dict]) -> None:
+        if isinstance(items, dict):
+            keys = list(items.keys())
+            records = [_to_record(v) for v in items.values()]
+        elif isinstance(items, (list, tuple)):
+            keys = list(items)
+            records = [{} for _ in keys]
+        else:
+            raise NotImplementedError
+
+        self.__size = len(keys)
+        self.__keys = np.empty(self.__size, dtype=object)
+        self.__keys[:] = keys
+        self.__rows = {k: i for i, k in enumerate(keys)}
+        if len(self.__rows) != self.__size:
+            raise ValueError("Duplicated items")
+
+        names = {}
+        for record in records:
+            names.update(dict.fromkeys(record))
+        self.__columns = {}
+        self.__present = {}
+        for name in names:
+            present = np.fromiter((name in r for r in records), bool, self.__size)
+            values = [r[name] for r in records if name in r]
+            dtype = reduce(_promote, {_infer_dtype(v) for v in values})
+            column = np.full(self.__size, _FILL_VALUES[dtype], dtype=dtype)
+            if dtype == object:
+                values = np.fromiter(values, dtype=object, count=len(values))
+            column[present] = values
+            self.__columns[name] = column
+            self.__present[name] = present
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__keys)
+
+    def __reserve(self, size: int) -> None:
+        if size <= self.capacity:
+            return
+        capacity = max(size, 2 * self.capacity, 16)
+
+        def grow(array: np.ndarray, fill: Any) -> np.ndarray:
+            new_array = np.full(capacity, fill, dtype=array.dtype)
+            new_array[: self.__size] = array[: self.__size]
+            return new_array
+
+        self.__keys = grow(self.__keys, None)
+        for name, column in self.__columns.items():
+            self.__columns[name] = grow(column, _FILL_VALUES[column.dtype])
+            self.__present[name] = grow(self.__present[name], False)
+
+    def __fit(self, name: Any, value: Any) -> np.ndarray:
+        """
+        Make sure column `name` exists and can hold `value`, upcasting if needed.
+        """
+        dtype = _infer_dtype(value)
+        if name not in self.__columns:
+            self.__columns[name] = np.full(self.capacity, _FILL_VALUES[dtype], dtype=dtype)
+            self.__present[name] = np.zeros(self.capacity, dtype=bool)
+            return self.__columns[name]
+
+        column = self.__columns[name]
+        new_dtype = _promote(column.dtype, dtype)
+        if new_dtype != column.dtype:
+            new_column = np.full(self.capacity, _FILL_VALUES[new_dtype], dtype=new_dtype)
+            present = self.__present[name]
+            new_column[present] = column[present]
+            self.__columns[name] = column = new_column
+        return column
+
+    def add_item(self, item, value) -> bool:
+        if item in self.__rows:
+            return False
+        self.__reserve(self.__size + 1)
+        row = self.__size
+        self.__keys[row] = item
+        self.__rows[item] = row
+        self.__size += 1
+        for name, v in _to_record(value).items():
+            self.__fit(name, v)[row] = v
+            self.__present[name][row] = True
+        return True
+
+    def set_attri(self, name: Any, value: Any, items: list = None):
+        if items is not None:
+            rows = np.fromiter((self.__rows[item] for item in items), np.int64)
+        else:
+            rows = slice(0, self.__size)
+
+        column = self.__fit(name, value)
+        if column.dtype == object:
+            # wrap to keep sequences as single values instead of broadcasting
+            holder = np.empty(1, dtype=object)
+            holder[0] = value
+            value = holder
+        column[rows] = value
+        self.__present[name][rows] = True
+
+    def __mask(self, node: Union[Condition, ConditionGroup]) -> np.ndarray:
+        n = self.__size
+        if isinstance(node, ConditionGroup):
+            is_and = node.mode == "and"
+            mask = np.full(n, is_and, dtype=bool)
+            for child in node.children:
+                if is_and:
+                    mask &= self.__mask(child)
+                    if not mask.any():
+                        break
+                else:
+                    mask |= self.__mask(child)
+                    if mask.all():
+                        break
+            return mask
+
+        column = self.__columns[node.attri][:n]
+        present = self.__present[node.attri][:n]
+        result = None
+        if node.oper in _VECTORIZED_OPERATORS and not isinstance(
+            node.value, (list, tuple, set, dict, np.ndarray)
+        ):
+            try:
+                result = _OPERATORS[node.oper](column, node.value)
+            except TypeError:
+                result = None
+        elif node.oper in ("in", "not in") and column.dtype != object:
+            values = list(node.value)
+            if all(isinstance(v, (bool, int, float, np.number)) for v in values):
+                result = np.isin(column, values, invert=node.oper == "not in")
+        elif node.oper in ("is None", "is not None") and column.dtype != object:
+            result = np.full(n, node.oper == "is not None", dtype=bool)
+
+        if not isinstance(result, np.ndarray) or result.shape != (n,):
+            # only present rows, placeholders may not support the operator
+            rows = np.flatnonzero(present)
+            result = np.zeros(n, dtype=bool)
+            result[rows] = np.fromiter(
+                (bool(node.func(v)) for v in column[rows].tolist()), bool, len(rows)
+            )
+        return np.asarray(result, dtype=bool) & present
+
+    def select_mask(self, conditions: Union[list, ConditionGroup]) -> np.ndarray:
+        """
+        Boolean mask over items (in insertion order) matching the conditions.
+        """
+        return self.__mask(compile_conditions(conditions))
+
+    def select_keys(self, conditions: Union[list, ConditionGroup]) -> np.ndarray:
+        return self.__keys[: self.__size][self.select_mask(conditions)]
+
+    def select(self, conditions: Union[list, ConditionGroup]) -> dict:
+        """
+        Same as `AttriManager.select`, evaluated column by column.
+        """
+        rows = np.flatnonzero(self.select_mask(conditions))
+        return self.__records(rows)
+
+    def __records(self, rows: np.ndarray) -> dict:
+        records = [{} for _ in range(len(rows))]
+        for name, column in self.__columns.items():
+            present = self.__present[name][rows]
+            values = column[rows].tolist()
+            for record, flag, value in zip(records, present.tolist(), values):
+                if flag:
+                    record[name] = value
+        return dict(zip(self.__keys[rows].tolist(), records))
+
+    def column(self, name: Any) -> np.ndarray:
+        """
+        View of the attribute array, aligned with `keys`.
+        """
+        return self.__columns[name][: self.__size]
+
+    @property
+    def keys(self) -> np.ndarray:
+        return self.__keys[: self.__size]
+
+    @property
+    def table(self) -> dict:
+        return self.__records(np.arange(self.__size))
+
+    def update(self, source: Union[str, dict]) -> None:
+        if isinstance(source, str):
+            with open(source, "r", encoding="utf-8") as f:
+                source = json.load(f)
+        if not isinstance(source, dict):
+            raise NotImplementedError
+        self.__load(source)
+
+    # columns are always scanned vectorized, so indexes are accepted but not kept
+    def create_index(self, name: Any, kind: str = "hash") -> None:
+        if kind not in _INDEX_TYPES:
+            raise ValueError(f"Unsupported index kind: {kind}")
+
+    def drop_index(self, name: Any, kind: str = None) -> None:
+        pass
+
+    def reindex(self) -> None:
+        pass
+
+    @property
+    def indexes(self) -> List[Tuple[Any, str]]:
+        return []
+
+    def explain(self, conditions: Union[list, ConditionGroup]) -> dict:
+        plan = compile_conditions(conditions)
+        return {"plan": repr(plan), "scan": "vectorized", "index": None, "candidates": len(self)}
+
+    @property
+    def attri_names(self) -> List[str]:
+        return list(self.__columns.keys())
+
+    def __getitem__(self, item) -> dict:
+        return self.__records(np.array([self.__rows[item]]))[item]
+
+    def __contains__(self, item) -> bool:
+        return item in self.__rows
+
+    def __len__(self) -> int:
+        return self.__size
+
+
+def _quote(name: Any) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _encode(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return json.dumps(value)
+
+
+def _tag(value: Any) -> Union[str, None]:
+    """
+    How a stored value has to be decoded, None for values SQLite keeps as is.
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, (bool, np.bool_)):
+        return "bool"
+    if isinstance(value, (int, float, str, bytes, np.generic)):
+        return None
+    return "json"
+
+
+def _decode(value: Any, tag: str) -> Any:
+    if tag == "bool":
+        return bool(value)
+    if tag == "json":
+        return json.loads(value)
+    return value
+
+
+class SqliteAttriManager(object):
+    """
+    AttriManager stored in a local SQLite file, one column per attribute.
+
+    Opening is instant whatever the table size, `select` runs as parameterized
+    SQL (see `create_index`) and `iter_select` streams results with bounded
+    memory. Writes are grouped into transactions of `batch_size` statements;
+    call `commit()` (or use the manager as a context manager) to flush.
+
+    Scalars are stored natively by SQLite so that they compare in SQL, non-scalar
+    values as JSON text. A side table tags the values needing decoding (bools,
+    JSON, explicit None), so records read back as written and attributes an item
+    never had stay absent.
+
+    Usage:
+      >>> with SqliteAttriManager("attris.db") as manager:
+      ...     manager.create_index("split")
+      ...     val = manager.select([("split", "==", "val"), ("score", ">", 0.5)])
+    """
+
+    KEY = "__item__"
+
+    def __init__(self, path: str, batch_size: int = 10000) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.__conn = sqlite3.connect(path)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=NORMAL")
+        self.__conn.execute(
+            f"CREATE TABLE IF NOT EXISTS items ({_quote(self.KEY)} PRIMARY KEY)"
+        )
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS tags (item, name, tag, PRIMARY KEY (item, name))"
+            " WITHOUT ROWID"
+        )
+        self.__conn.commit()
+        self.__columns = [
+            row[1]
+            for row in self.__conn.execute("PRAGMA table_info(items)")
+            if row[1] != self.KEY
+        ]
+        self.__pending = 0
+        key = _quote(self.KEY)
+        tags = f"SELECT json_group_object(name, tag) FROM tags WHERE item = items.{key}"
+        self.__select = f"SELECT items.*, ({tags}) FROM items"
+
+    @classmethod
+    def from_file(cls, path: str) -> "SqliteAttriManager":
+        return cls(path)
+
+    @classmethod
+    def from_json(cls, json_path: str, path: str) -> "SqliteAttriManager":
+        """
+        Import a table written by `AttriManager.dump` into a new SQLite file.
+        """
+        with open(json_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        manager = cls(path)
+        manager.add_items(info)
+        manager.commit()
+        return manager
+
+    def __written(self, count: int = 1) -> None:
+        self.__pending += count
+        if self.__pending >= self.batch_size:
+            self.commit()
+
+    def commit(self) -> None:
+        self.__conn.commit()
+        self.__pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self.__conn.close()
+
+    def __enter__(self) -> "SqliteAttriManager":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __ensure_columns(self, names: List[Any]) -> None:
+        for name in names:
+            if name not in self.__columns:
+                self.__conn.execute(f"ALTER TABLE items ADD COLUMN {_quote(name)}")
+                self.__columns.append(name)
+
+    def __tags_of(self, item: Any, record: dict) -> list:
+        return [(item, k, t) for k, t in ((k, _tag(v)) for k, v in record.items()) if t]
+
+    def add_item(self, item, value) -> bool:
+        record = _to_record(value)
+        self.__ensure_columns(list(record.keys()))
+        names = ", ".join(_quote(x) for x in [self.KEY] + list(record.keys()))
+        marks = ", ".join("?" * (len(record) + 1))
+        cursor = self.__conn.execute(
+            f"INSERT OR IGNORE INTO items ({names}) VALUES ({marks})",
+            [item] + [_encode(v) for v in record.values()],
+        )
+        if cursor.rowcount != 1:
+            return False
+        self.__conn.executemany(
+            "INSERT OR REPLACE INTO tags VALUES (?, ?, ?)", self.__tags_of(item, record)
+        )
+        self.__written()
+        return True
+
+    def add_items(self, items: dict) -> None:
+        """
+        Bulk `add_item` over a `{item: record}` mapping.
+        """
+        groups = {}  # attribute names -> rows
+        tags = []
+        for item, value in items.items():
+            record = _to_record(value)
+            names = tuple(record.keys())
+            groups.setdefault(names, []).append([item] + [_encode(v) for v in record.values()])
+            tags.extend(x + (item,) for x in self.__tags_of(item, record))
+
+        # tag first, only items that are not in the table yet
+        self.__conn.executemany(
+            "INSERT OR REPLACE INTO tags SELECT ?, ?, ? WHERE NOT EXISTS"
+            f" (SELECT 1 FROM items WHERE {_quote(self.KEY)} = ?)",
+            tags,
+        )
+
+        for names, rows in groups.items():
+            self.__ensure_columns(list(names))
+            columns = ", ".join(_quote(x) for x in (self.KEY,) + names)
+            marks = ", ".join("?" * (len(names) + 1))
+            sql = f"INSERT OR IGNORE INTO items ({columns}) VALUES ({marks})"
+            for i in range(0, len(rows), self.batch_size):
+                self.__conn.executemany(sql, rows[i : i + self.batch_size])
+                self.__written(len(rows[i : i + self.batch_size]))
+
+    def set_attri(self, name: Any, value: Any, items: list = None):
+        self.__ensure_columns([name])
+        tag, value = _tag(value), _encode(value)
+        if items is None:
+            self.__conn.execute(f"UPDATE items SET {_quote(name)} = ?", (value,))
+            self.__conn.execute("DELETE FROM tags WHERE name = ?", (name,))
+            if tag:
+                self.__conn.execute(
+                    f"INSERT INTO tags SELECT {_quote(self.KEY)}, ?, ? FROM items", (name, tag)
+                )
+            self.__written()
+            return
+
+        sql = f"UPDATE items SET {_quote(name)} = ? WHERE {_quote(self.KEY)} = ?"
+        if tag:
+            tag_sql = (
+                "INSERT OR REPLACE INTO tags SELECT ?, ?, ? WHERE EXISTS"
+                f" (SELECT 1 FROM items WHERE {_quote(self.KEY)} = ?)"
+            )
+        else:
+            tag_sql = "DELETE FROM tags WHERE item = ? AND name = ?"
+        items = list(items)
+        for i in range(0, len(items), self.batch_size):
+            chunk = items[i : i + self.batch_size]
+            self.__conn.executemany(sql, ((value, item) for item in chunk))
+            if tag:
+                self.__conn.executemany(tag_sql, ((item, name, tag, item) for item in chunk))
+            else:
+                self.__conn.executemany(tag_sql, ((item, name) for item in chunk))
+            self.__written(len(chunk))
+
+    def create_index(self, name: Any) -> None:
+        if name not in self.__columns:
+            raise KeyError(name)
+        index = _quote("idx_" + str(name))
+        self.__conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON items ({_quote(name)})")
+        self.commit()
+
+    def drop_index(self, name: Any) -> None:
+        self.__conn.execute(f"DROP INDEX IF EXISTS {_quote('idx_' + str(name))}")
+        self.commit()
+
+    def __tagged(self, name: Any, tag: str, params: list) -> str:
+        params.extend((name, tag))
+        return (
+            f"EXISTS (SELECT 1 FROM tags WHERE item = items.{_quote(self.KEY)}"
+            " AND name = ? AND tag = ?)"
+        )
+
+    def __to_sql(self, node: Union[Condition, ConditionGroup], params: list) -> str:
+        """
+        Items lacking the attribute never match, unlike an explicit None.
+        """
+        if isinstance(node, ConditionGroup):
+            if not node.children:
+                return "1" if node.mode == "and" else "0"
+            joiner = " AND " if node.mode == "and" else " OR "
+            return "(" + joiner.join(self.__to_sql(c, params) for c in node.children) + ")"
+
+        if node.attri not in self.__columns:
+            raise KeyError(node.attri)
+        column, oper, value = _quote(node.attri), node.oper, node.value
+        if oper in ("is", "is not") and value is not None:
+            raise ValueError(f"Operator {oper!r} is only supported with None")
+        if oper in ("is None", "is") or (oper == "==" and value is None):
+            return f"({column} IS NULL AND {self.__tagged(node.attri, 'null', params)})"
+        if oper in ("is not None", "is not") or (oper == "!=" and value is None):
+            return f"{column} IS NOT NULL"
+        if oper == "==":
+            params.append(_encode(value))
+            return f"{column} = ?"
+        if oper == "!=":
+            params.append(_encode(value))
+            return f"({column} <> ? OR {self.__tagged(node.attri, 'null', params)})"
+        if oper in ("<", "<=", ">", ">="):
+            params.append(_encode(value))
+            return f"{column} {oper} ?"
+
+        if isinstance(value, (str, bytes)):
+            # python `in` is a substring test here, only against values of the same type
+            kind = "text" if isinstance(value, str) else "blob"
+            found = "> 0" if oper == "in" else "= 0"
+            sql = f"(typeof({column}) = '{kind}'"
+            if kind == "text":
+                sql += f" AND NOT {self.__tagged(node.attri, 'json', params)}"
+            params.append(value)
+            return sql + f" AND instr(?, {column}) {found})"
+
+        # in / not in, with python semantics for an explicit None
+        values = [_encode(v) for v in value if v is not None]
+        with_none = len(values) != len(list(value))
+        if len(values) > 500:
+            params.append(json.dumps(values))
+            members = f"{column} IN (SELECT value FROM json_each(?))"
+        elif values:
+            params.extend(values)
+            members = f"{column} IN ({', '.join('?' * len(values))})"
+        else:
+            members = "0"
+        if oper == "in" and not with_none:
+            return members
+        if oper == "not in" and with_none:
+            return f"({column} IS NOT NULL AND NOT {members})"
+        # placeholders follow the members ones
+        explicit_none = f"({column} IS NULL AND {self.__tagged(node.attri, 'null', params)})"
+        if oper == "in":
+            return f"({members} OR {explicit_none})"
+        return f"(({column} IS NOT NULL AND NOT {members}) OR {explicit_none})"
+
+    def __query(self, conditions: Union[list, ConditionGroup]) -> Tuple[str, list]:
+        params = []
+        where = self.__to_sql(compile_conditions(conditions), params)
+        return f"{self.__select} WHERE {where}", params
+
+    @staticmethod
+    def __record(names: List[str], row: tuple) -> dict:
+        """
+        Rebuild a record from a `__select` row, dropping attributes never set.
+        """
+        tags = json.loads(row[-1])
+        record = {}
+        for name, value in zip(names, row[1:-1]):
+            tag = tags.get(name)
+            if value is not None or tag is not None:
+                record[name] = _decode(value, tag)
+        return record
+
+    def explain(self, conditions: Union[list, ConditionGroup]) -> dict:
+        sql, params = self.__query(conditions)
+        details = [row[-1] for row in self.__conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        return {"sql": sql, "params": params, "plan": details}
+
+    def iter_select(self, conditions: Union[list, ConditionGroup], chunk: int = 1000):
+        """
+        Same as `select` but yields `(item, record)` pairs lazily.
+        """
+        sql, params = self.__query(conditions)
+        cursor = self.__conn.execute(sql, params)
+        names = [x[0] for x in cursor.description][1:-1]
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0], self.__record(names, row)
+
+    def select(self, conditions: Union[list, ConditionGroup]) -> dict:
+        return dict(self.iter_select(conditions))
+
+    def dump(self, path: str) -> None:
+        """
+        Export as JSON in the `AttriManager.dump` layout, streaming row by row.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{")
+            for i, (item, record) in enumerate(self.iter_select([])):
+                f.write(",\n  " if i else "\n  ")
+                f.write(json.dumps(str(item)) + ": " + json.dumps(record))
+            f.write("\n}\n")
+
+    @property
+    def attri_names(self) -> List[str]:
+        return list(self.__columns)
+
+    def __getitem__(self, item) -> dict:
+        cursor = self.__conn.execute(
+            f"{self.__select} WHERE {_quote(self.KEY)} = ?", (item,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(item)
+        return self.__record([x[0] for x in cursor.description][1:-1], row)
+
+    def __contains__(self, item) -> bool:
+        sql = f"SELECT 1 FROM items WHERE {_quote(self.KEY)} = ?"
+        return self.__conn.execute(sql, (item,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.__conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
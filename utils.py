@@ -1,5 +1,15 @@
-from typing import Union, List, Tuple, Any
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import asyncio
+from collections import deque
+from itertools import islice
+from typing import Union, List, Tuple, Any, Iterable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 
 from tqdm import tqdm
 
@@ -20,6 +30,262 @@ class Struct(object):
         return str(self.__dict__)
 
 
+_UNSET = object()
+
+
+class Schema(object):
+    """
+    Attribute layout shared by many `Record`s: name -> position in values.
+    """
+
+    __slots__ = ("names", "positions")
+
+    def __init__(self, names: Union[List, Tuple] = ()):
+        self.names = []
+        self.positions = {}
+        for name in names:
+            self.add(name)
+
+    def add(self, name: Any) -> int:
+        if name not in self.positions:
+            self.positions[name] = len(self.names)
+            self.names.append(name)
+        return self.positions[name]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return "Schema(%s)" % self.names
+
+
+class Record(object):
+    """
+    Compact replacement of `Struct` for many records with the same attributes.
+
+    Keys live once in a shared `Schema`, each record only holds a list of
+    values, and both `record.name` and `record["name"]` access are supported.
+    Attributes named like a method (`keys`, `get`, `map`...) need item access.
+
+    Usage:
+      >>> schema = Schema()
+      >>> records = [Record(schema) for _ in range(3)]
+      >>> records[0]["score"] = 0.5
+      >>> assert records[0].score == 0.5 and "score" not in records[1]
+    """
+
+    __slots__ = ("_schema", "_values")
+
+    def __init__(self, schema: Schema = None, **kwargs):
+        object.__setattr__(self, "_schema", schema if schema is not None else Schema())
+        object.__setattr__(self, "_values", [])
+        for k, v in kwargs.items():
+            self[k] = v
+
+    def __getitem__(self, name):
+        pos = self._schema.positions.get(name)
+        if pos is None or pos >= len(self._values) or self._values[pos] is _UNSET:
+            raise KeyError(name)
+        return self._values[pos]
+
+    def __setitem__(self, name, value):
+        pos = self._schema.add(name)
+        values = self._values
+        if pos >= len(values):
+            # grow to the whole schema with an exact-size list, no over-allocation
+            values = values + [_UNSET] * (len(self._schema) - len(values))
+            object.__setattr__(self, "_values", values)
+        values[pos] = value
+
+    def __delitem__(self, name):
+        _ = self[name]
+        self._values[self._schema.positions[name]] = _UNSET
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in Record.__slots__:
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, name):
+        pos = self._schema.positions.get(name)
+        return pos is not None and pos < len(self._values) and self._values[pos] is not _UNSET
+
+    def keys(self) -> list:
+        names = self._schema.names
+        return [names[i] for i, v in enumerate(self._values) if v is not _UNSET]
+
+    def values(self) -> list:
+        return [v for v in self._values if v is not _UNSET]
+
+    def items(self) -> list:
+        names = self._schema.names
+        return [(names[i], v) for i, v in enumerate(self._values) if v is not _UNSET]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, Struct)):
+            return self.map == other.map
+        return self.map == other
+
+    @property
+    def map(self) -> dict:
+        return dict(self.items())
+
+    @property
+    def attri(self) -> list:
+        return self.keys()
+
+    def __getstate__(self):
+        return self._schema, self.map
+
+    def __setstate__(self, state):
+        schema, mapping = state
+        object.__setattr__(self, "_schema", schema)
+        object.__setattr__(self, "_values", [])
+        for k, v in mapping.items():
+            self[k] = v
+
+    def __repr__(self):
+        return str(self.map)
+
+
+def _run_chunk(func: Any, chunk: list, return_exceptions: bool) -> list:
+    results = []
+    for args in chunk:
+        try:
+            results.append(func(*args))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+def _iter_chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_parallel(
+    func: Any,
+    args_list: Iterable,
+    max_workers: int = None,
+    backend: str = "thread",
+    chunksize: int = 1,
+    max_inflight: int = None,
+    ordered: bool = True,
+    return_exceptions: bool = False,
+    progress: bool = True,
+    total: int = None,
+) -> Iterator[Any]:
+    """
+    Run a function in parallel and yield results as they are ready.
+
+    Args:
+        func (Any): The function to be executed, called as `func(*args)`.
+            Must be picklable (module level) for the process backend.
+        args_list (Iterable): Arguments of each task, consumed lazily.
+        max_workers (int, optional): Defaults to 32 threads or one process per CPU.
+        backend (str, optional): `thread` for I/O bound work, `process` for CPU bound work.
+        chunksize (int, optional): Number of tasks sent to a worker at once.
+        max_inflight (int, optional): Maximum number of chunks submitted but
+            not yet yielded, which bounds memory. Defaults to 2 * max_workers.
+        ordered (bool, optional): Yield in the order of `args_list`, otherwise
+            in completion order.
+        return_exceptions (bool, optional): Yield the exception raised by a task
+            in place of its result instead of aborting the whole run.
+        progress (bool, optional): Show a tqdm progress bar.
+        total (int, optional): Number of tasks for the progress bar, defaults
+            to `len(args_list)` when available.
+
+    Usage:
+      >>> for mask in iter_parallel(render, [(path,) for path in paths], backend="process", chunksize=64):
+      ...     save(mask)
+    """
+    if backend == "thread":
+        pool_cls = ThreadPoolExecutor
+        max_workers = max_workers or 32
+    elif backend == "process":
+        pool_cls = ProcessPoolExecutor
+        max_workers = max_workers or os.cpu_count()
+    else:
+        raise ValueError(f"Unsupported backend: {backend}")
+    max_inflight = max_inflight or 2 * max_workers
+    if total is None and hasattr(args_list, "__len__"):
+        total = len(args_list)
+
+    chunks = _iter_chunks(args_list, chunksize)
+    bar = tqdm(total=total, disable=not progress)
+    executor = pool_cls(max_workers=max_workers)
+    try:
+        def submit() -> Union[Future, None]:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return None
+            return executor.submit(_run_chunk, func, chunk, return_exceptions)
+
+        if ordered:
+            inflight = deque()
+            for _ in range(max_inflight):
+                future = submit()
+                if future is None:
+                    break
+                inflight.append(future)
+            while inflight:
+                results = inflight.popleft().result()
+                future = submit()
+                if future is not None:
+                    inflight.append(future)
+                bar.update(len(results))
+                yield from results
+        else:
+            inflight = set()
+            for _ in range(max_inflight):
+                future = submit()
+                if future is None:
+                    break
+                inflight.add(future)
+            while inflight:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results = future.result()
+                    new_future = submit()
+                    if new_future is not None:
+                        inflight.add(new_future)
+                    bar.update(len(results))
+                    yield from results
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        bar.close()
+
+
 def run_parallel(func: Any, args_list: Union[List, Tuple], max_workers:int = 32):
     """"
     Run a function in parallel using ThreadPoolExecutor.
@@ -30,12 +296,100 @@ def run_parallel(func: Any, args_list: Union[List, Tuple], max_workers:int = 32)
         max_workers (int, optional): The maximum number of workers to use. Defaults to 32.
 
     Returns:
-        List: A list of results returned by the function for each argument in the args_list.
+        List: A list of results returned by the function for each argument in the args_list,
+            in the same order. See `iter_parallel` for processes and streaming.
     """
-    max_workers = min(max_workers, len(args_list))
-    results = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(func, *args) for args in args_list]
-        for future in tqdm(as_completed(futures), total=len(futures)):
-            results.append(future.result())
-    return results
+    max_workers = max(1, min(max_workers, len(args_list)))
+    return list(iter_parallel(func, args_list, max_workers=max_workers))
+
+
+class _RateLimiter(object):
+    """
+    Space task starts evenly so that at most `rate` start per second.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.__next_time = 0.0
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.__lock:
+            now = asyncio.get_running_loop().time()
+            delay = self.__next_time - now
+            self.__next_time = max(now, self.__next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def gather_async(
+    coro_func: Any,
+    args_list: Union[List, Tuple],
+    concurrency: int = 64,
+    timeout: float = None,
+    retries: int = 0,
+    backoff: float = 0.5,
+    retry_on: Tuple[type, ...] = (Exception,),
+    rate_limit: float = None,
+    return_exceptions: bool = False,
+    progress: bool = True,
+) -> list:
+    """
+    Asyncio counterpart of `run_parallel` for I/O bound coroutine functions.
+
+    Args:
+        coro_func (Any): Coroutine function called as `coro_func(*args)`.
+        args_list (Union[List, Tuple]): Arguments of each task.
+        concurrency (int, optional): Maximum number of tasks running at once.
+        timeout (float, optional): Timeout in seconds of each attempt.
+        retries (int, optional): Extra attempts after a failure in `retry_on`.
+        backoff (float, optional): Delay before the first retry, doubled on each retry.
+        retry_on (Tuple[type, ...], optional): Exception types worth retrying,
+            timeouts included.
+        rate_limit (float, optional): Maximum number of attempts started per second.
+        return_exceptions (bool, optional): Put the final exception of a failed
+            task in place of its result instead of raising.
+        progress (bool, optional): Show a tqdm progress bar.
+
+    Returns:
+        List: Results in the order of args_list.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = _RateLimiter(rate_limit) if rate_limit else None
+    bar = tqdm(total=len(args_list), disable=not progress)
+
+    async def run_one(args):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                if limiter is not None:
+                    await limiter.acquire()
+                try:
+                    if timeout is None:
+                        return await coro_func(*args)
+                    return await asyncio.wait_for(coro_func(*args), timeout)
+                except retry_on:
+                    if attempt == retries:
+                        raise
+                await asyncio.sleep(backoff * 2**attempt)
+
+    tasks = [asyncio.ensure_future(run_one(args)) for args in args_list]
+    for task in tasks:
+        task.add_done_callback(lambda _: bar.update(1))
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    finally:
+        for task in tasks:
+            task.cancel()
+        bar.close()
+
+
+def run_async(coro_func: Any, args_list: Union[List, Tuple], **kwargs) -> list:
+    """
+    Synchronous entry point of `gather_async`, managing the event loop.
+
+    Usage:
+      >>> async def fetch(url):
+      ...     ...
+      >>> contents = run_async(fetch, [(url,) for url in urls], concurrency=256, retries=3)
+    """
+    return asyncio.run(gather_async(coro_func, args_list, **kwargs))
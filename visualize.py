@@ -1,7 +1,13 @@
+import os
+import zlib
+import hashlib
+from functools import lru_cache
 from typing import List
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
+
+from filesystem import read_json_file, write_json_file
+from utils import iter_parallel
 
 
 def heatmap(data, ax=None, cbar_kw=None, cbarlabel="", **kwargs):
@@ -34,6 +40,8 @@ def heatmap(data, ax=None, cbar_kw=None, cbarlabel="", **kwargs):
     """
 
     if ax is None:
+        import matplotlib.pyplot as plt
+
         ax = plt.gca()
 
     if cbar_kw is None:
@@ -50,23 +58,177 @@ def heatmap(data, ax=None, cbar_kw=None, cbarlabel="", **kwargs):
     return im, cbar
 
 
-def create_color_bar(with_black=True) -> np.ndarray:
-    H = (180, 90, 120, 60, 160, 10, 100, 40, 150, 30, 140, 80, 20)
-    S = (250, 140, 160, 190, 220)
-    V = (250, 180, 90, 210, 130)
-    h_size, s_size, v_size = len(H), len(S), len(V)
-    color_bar = np.zeros((1, h_size * s_size * v_size, 3))
+def decimate(data: np.ndarray, max_size: int, mode="max") -> np.ndarray:
+    """
+    Pool a 2d array by an integer factor so that its longer side is at most
+    `max_size`. `max` keeps isolated peaks visible, `mean` averages them out.
+    Edge blocks are padded by repeating the last row / column.
+    """
+    factor = -(-max(data.shape[:2]) // max_size) if max_size else 1
+    if factor <= 1:
+        return np.asarray(data)
+    height, width = data.shape[:2]
+    pad_h, pad_w = -height % factor, -width % factor
+    if pad_h or pad_w:
+        data = np.pad(data, ((0, pad_h), (0, pad_w)), mode="edge")
+    blocks = data.reshape(data.shape[0] // factor, factor, data.shape[1] // factor, factor)
+    if mode == "max":
+        return blocks.max(axis=(1, 3))
+    if mode == "mean":
+        return blocks.mean(axis=(1, 3))
+    raise ValueError(f"Unsupported mode: {mode}")
 
-    for i in range(h_size * s_size * v_size):
-        color_bar[0][i] = np.array(
-            [H[i % h_size], S[i % s_size], V[i % v_size]], dtype=np.uint8
-        )
-    color_bar = cv2.cvtColor(color_bar.astype(np.uint8), cv2.COLOR_HSV2BGR)
+
+@lru_cache(maxsize=None)
+def _cmap_lut(cmap: str) -> np.ndarray:
+    """
+    `(256, 3)` BGR table of a matplotlib colormap.
+    """
+    import matplotlib
+
+    rgba = matplotlib.colormaps[cmap](np.linspace(0, 1, 256))
+    lut = np.round(rgba[:, 2::-1] * 255).astype(np.uint8)
+    lut.setflags(write=False)
+    return lut
+
+
+def render_heatmap(
+    data,
+    path: str,
+    max_size=1024,
+    pool="max",
+    cmap="viridis",
+    vmin=None,
+    vmax=None,
+    fast=True,
+    cbarlabel="",
+    dpi=100,
+) -> str:
+    """
+    Save a heatmap without pyplot, so it is safe in threads and processes.
+
+    The array is pooled down to `max_size` pixels first. The fast path maps
+    values through a 256-color table of `cmap` straight to an image file;
+    otherwise `heatmap` draws it with a colorbar on an Agg canvas.
+
+    Args:
+        data(np.ndarray | str): 2d array, or a `.npy` file read memory-mapped.
+        pool(str): `max` or `mean`, see `decimate`.
+        vmin, vmax: color range, defaults to the data range.
+
+    Usage:
+      >>> render_heatmap(diff, "diff.png", max_size=2048)
+    """
+    if isinstance(data, str):
+        data = np.load(data, mmap_mode="r")
+    data = decimate(data, max_size, pool)
+    vmin = np.nanmin(data) if vmin is None else vmin
+    vmax = np.nanmax(data) if vmax is None else vmax
+
+    if fast:
+        # in float, integer maps would wrap below vmin
+        vmin, vmax = float(vmin), float(vmax)
+        scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+        idx = np.nan_to_num((data.astype(np.float32) - vmin) * scale, nan=0.0).clip(0, 255).astype(np.uint8)
+        if not cv2.imwrite(path, _cmap_lut(cmap)[idx]):
+            raise IOError(f"Failed to write {path}")
+        return path
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    height, width = data.shape
+    fig = Figure(figsize=(width / dpi + 1.5, height / dpi + 0.5), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    heatmap(data, ax=ax, cbarlabel=cbarlabel, cmap=cmap, vmin=vmin, vmax=vmax)
+    fig.savefig(path)
+    return path
+
+
+def render_heatmaps(items, max_workers: int = None, progress=True, **kwargs) -> List[str]:
+    """
+    `render_heatmap` over `(data, path)` items in a process pool. Passing
+    `.npy` paths rather than arrays avoids pickling the full arrays.
+
+    Usage:
+      >>> render_heatmaps([(f, f.replace(".npy", ".png")) for f in files], max_size=2048)
+    """
+    tasks = [(data, path, kwargs) for data, path in items]
+    return list(
+        iter_parallel(_render_heatmap_task, tasks, max_workers=max_workers, backend="process", progress=progress)
+    )
+
+
+def _render_heatmap_task(data, path: str, kwargs: dict) -> str:
+    return render_heatmap(data, path, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def create_color_bar(with_black=True, mode="bgr") -> np.ndarray:
+    """
+    Palette of 325 distinct colors, preceded by black when `with_black`.
+    Cached per arguments, so the returned array is read-only.
+    """
+    assert mode in ("bgr", "rgb")
+    H = np.array((180, 90, 120, 60, 160, 10, 100, 40, 150, 30, 140, 80, 20), dtype=np.uint8)
+    S = np.array((250, 140, 160, 190, 220), dtype=np.uint8)
+    V = np.array((250, 180, 90, 210, 130), dtype=np.uint8)
+    idx = np.arange(len(H) * len(S) * len(V))
+    hsv = np.stack([H[idx % len(H)], S[idx % len(S)], V[idx % len(V)]], axis=-1)
+    color_bar = cv2.cvtColor(hsv[np.newaxis], cv2.COLOR_HSV2BGR)[0]
     if with_black:
         black = np.array([[0, 0, 0]], dtype=np.uint8)
         color_bar = np.concatenate([black, color_bar], axis=0)
+    if mode == "rgb":
+        color_bar = np.ascontiguousarray(color_bar[:, ::-1])
+
+    color_bar.setflags(write=False)
+    return color_bar
+
+
+@lru_cache(maxsize=None)
+def _label_lut(size: int, with_black: bool, mode: str) -> np.ndarray:
+    """
+    Color of every id below `size`, wrapping ids beyond the palette while 0 stays black.
+    """
+    palette = create_color_bar(with_black, mode)
+    ids = np.arange(size)
+    if with_black:
+        ids = np.where(ids > 0, (ids - 1) % (len(palette) - 1) + 1, 0)
+    else:
+        ids = ids % len(palette)
+    lut = palette[ids]
+    lut.setflags(write=False)
+    return lut
+
+
+def colorize(label_map: np.ndarray, with_black=True, mode="bgr") -> np.ndarray:
+    """
+    Color an integer label or instance mask with one lookup per pixel.
+
+    Args:
+        label_map(np.ndarray): `(H, W)` ids, uint8 and uint16 use a cached table.
+        with_black(bool): keep id 0 black.
+        mode(str): `bgr` or `rgb`.
+
+    Usage:
+      >>> vis = colorize(mask)
+      >>> cv2.imwrite("mask.png", vis)
+    """
+    label_map = np.asarray(label_map)
+    if label_map.dtype in (np.uint8, np.uint16):
+        return _label_lut(np.iinfo(label_map.dtype).max + 1, with_black, mode)[label_map]
 
-    return np.squeeze(color_bar, axis=0)
+    palette = create_color_bar(with_black, mode)
+    label_map = label_map.astype(np.int64, copy=False)
+    if label_map.min(initial=0) < 0:
+        raise ValueError("Expect non-negative ids")
+    if with_black:
+        ids = np.where(label_map > 0, (label_map - 1) % (len(palette) - 1) + 1, 0)
+    else:
+        ids = label_map % len(palette)
+    return palette[ids]
 
 
 class ColorBar(object):
@@ -95,7 +257,7 @@ class ColorBar(object):
     def __init__(self, mode="bgr", black_in_bar=False):
         assert mode in ("bgr", "rgb")
         self.mode = mode
-        self.__bar = create_color_bar(black_in_bar)
+        self.__bar = create_color_bar(black_in_bar, mode)
 
         for k, v in self.__COLOR_BGR.items():
             v = v[::-1] if self.mode == "rgb" else v
@@ -108,3 +270,184 @@ class ColorBar(object):
     @property
     def namedcolors(self) -> List[str]:
         return list(self.__COLOR_BGR.keys())
+
+
+def label_color(label: str, mode="bgr") -> tuple:
+    """
+    Palette color of a label, the same across images, runs and processes.
+    """
+    palette = create_color_bar(False, mode)
+    return tuple(int(x) for x in palette[zlib.crc32(label.encode("utf-8")) % len(palette)])
+
+
+def _as_shapes(annotations) -> List[tuple]:
+    """
+    `(label, polygons)` of `cvat_parser.AnnotationInstance`-like objects or
+    of `(label, polygons, ...)` tuples.
+    """
+    shapes = []
+    for ann in annotations:
+        if hasattr(ann, "label_name"):
+            label, polygons = ann.label_name, ann.points
+        else:
+            label, polygons = ann[0], ann[1]
+        polygons = [np.asarray(x, dtype=np.float32).reshape(-1, 2) for x in polygons]
+        shapes.append((label, [x for x in polygons if len(x)]))
+    return shapes
+
+
+def render_overlay(
+    img: np.ndarray,
+    annotations,
+    fill=True,
+    alpha=0.4,
+    thickness=2,
+    draw_labels=True,
+    max_size=1280,
+    colors: dict = None,
+) -> np.ndarray:
+    """
+    Draw annotations on a BGR image, downscaled first so that its longer
+    side is at most `max_size`.
+
+    Polygons are filled on one copy of the image which is alpha blended once,
+    then outlines are drawn with one `polylines` call per color.
+
+    Args:
+        annotations: `ImageInstance.annotations` or `(label, polygons, ...)` tuples.
+        colors(dict): label -> BGR color, defaults to `label_color`.
+
+    Usage:
+      >>> vis = render_overlay(cv2.imread(path), image.annotations)
+    """
+    scale = min(1.0, max_size / max(img.shape[:2])) if max_size else 1.0
+    if scale < 1.0:
+        size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    else:
+        img = img.copy()
+    colors = colors or {}
+
+    by_color = {}
+    labels = []
+    for label, polygons in _as_shapes(annotations):
+        if not polygons:
+            continue
+        color = colors[label] if label in colors else label_color(label)
+        polygons = [np.round(x * scale).astype(np.int32) for x in polygons]
+        by_color.setdefault(color, []).extend(polygons)
+        labels.append((label, color, min(polygons, key=lambda x: x[:, 1].min())))
+
+    if fill and by_color:
+        overlay = img.copy()
+        for color, polygons in by_color.items():
+            # one call per polygon, a single fillPoly call XORs overlapping ones
+            for polygon in polygons:
+                cv2.fillPoly(overlay, [polygon], color)
+        cv2.addWeighted(overlay, alpha, img, 1 - alpha, 0, dst=img)
+    if thickness > 0:
+        for color, polygons in by_color.items():
+            cv2.polylines(img, polygons, True, color, thickness, cv2.LINE_AA)
+    if draw_labels:
+        for label, color, polygon in labels:
+            x, y = polygon[np.argmin(polygon[:, 1])]
+            cv2.putText(img, label, (int(x), max(int(y) - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return img
+
+
+def _overlay_key(image_path: str, shapes: List[tuple], options: dict) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    stat = os.stat(image_path)
+    digest.update(repr((stat.st_size, stat.st_mtime_ns, sorted(options.items()))).encode("utf-8"))
+    for label, polygons in shapes:
+        digest.update(label.encode("utf-8") + b"\0")
+        for polygon in polygons:
+            digest.update(np.ascontiguousarray(polygon, dtype=np.float32).tobytes() + b"\0")
+    return digest.hexdigest()
+
+
+def _render_thumbnail(image_path: str, out_path: str, shapes: List[tuple], options: dict, params: List[int]):
+    img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise IOError(f"Cannot read {image_path}")
+    vis = render_overlay(img, shapes, **options)
+    ok, data = cv2.imencode(os.path.splitext(out_path)[1], vis, params)
+    if not ok:
+        raise RuntimeError(f"Failed to encode {out_path}")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "wb") as f:
+        f.write(data.tobytes())
+    return out_path
+
+
+def render_overlays(
+    items,
+    out_dir: str,
+    ext=".jpg",
+    quality=85,
+    max_workers: int = None,
+    progress=True,
+    **options,
+) -> List[str]:
+    """
+    Render review thumbnails in a process pool, skipping frames whose image,
+    annotations and options did not change since the last run.
+
+    The hash of each thumbnail is kept in `out_dir/.overlay_manifest.json`.
+    Frames that can't be read or rendered are reported and skipped, and are
+    retried on the next run.
+
+    Args:
+        items: `(image_path, name, annotations)`, the thumbnail being written to
+            `out_dir/<name without extension><ext>`.
+        ext(str): `.jpg` or `.webp`.
+        options: forwarded to `render_overlay`.
+
+    Returns:
+        paths of the thumbnails rendered in this run.
+
+    Usage:
+      >>> items = [(os.path.join(image_dir, x.name), x.name, x.annotations) for x in project.iter_images()]
+      >>> render_overlays(items, "review/", ext=".webp", max_size=960)
+    """
+    flag = cv2.IMWRITE_WEBP_QUALITY if ext == ".webp" else cv2.IMWRITE_JPEG_QUALITY
+    manifest_path = os.path.join(out_dir, ".overlay_manifest.json")
+    manifest = read_json_file(manifest_path) if os.path.exists(manifest_path) else {}
+
+    tasks, keys = [], {}
+    for image_path, name, annotations in items:
+        shapes = _as_shapes(annotations)
+        thumb = os.path.splitext(name)[0] + ext
+        out_path = os.path.join(out_dir, thumb)
+        try:
+            key = _overlay_key(image_path, shapes, dict(options, quality=quality))
+        except OSError as e:
+            print("Failed to render %s: %s" % (image_path, e))
+            continue
+        if manifest.get(thumb) == key and os.path.exists(out_path):
+            continue
+        keys[out_path] = (thumb, key)
+        tasks.append((image_path, out_path, shapes, options, [flag, quality]))
+
+    rendered = []
+    try:
+        results = iter_parallel(
+            _render_thumbnail,
+            tasks,
+            max_workers=max_workers,
+            backend="process",
+            return_exceptions=True,
+            progress=progress,
+        )
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                print("Failed to render %s: %s" % (task[0], result))
+                continue
+            out_path = result
+            thumb, key = keys[out_path]
+            manifest[thumb] = key
+            rendered.append(out_path)
+    finally:
+        os.makedirs(out_dir, exist_ok=True)
+        write_json_file(manifest_path, manifest)
+    return rendered